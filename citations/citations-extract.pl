@@ -251,25 +251,56 @@ sub findDoiLimit {
 
     my $directory = shift;
 
-    my @files = glob($directory . '/doi-registrants-*');
-    my $latest = (reverse sort @files)[0];
+    my $prefix;
 
-    my $file = File::ReadBackwards->new($latest)
-        or die "ERROR: Unable to open DOI file ($latest)\n --> $!\n\n";
+    # use the registrant store if available otherwise the latest file
 
-    my $line = $file->readline;
+    my $dbRegistrants = $directory . '/db-registrants.sqlite3';
 
-    if ($line =~ /^(10.\d+).*$/) {
-        my $prefix = $1;
-        # cannot simply use ceil as want 10.55000 to also go to 10.56000
-        $prefix = $prefix * 100;
-        $prefix = $prefix + 1;
-        $prefix = floor($prefix);
-        $prefix = $prefix / 100;
-        return $prefix;
+    if (-e $dbRegistrants) {
+
+        my $database = citationsDB->new;
+        $database->openDatabase($dbRegistrants);
+
+        my $sth = $database->prepare(q{
+            SELECT prefix FROM registrants
+            WHERE snapshot = (SELECT MAX(snapshot) FROM snapshots)
+            ORDER BY number DESC
+            LIMIT 1
+        });
+        $sth->execute();
+
+        ($prefix) = $sth->fetchrow_array();
+
+        $sth->finish();
+        $database->disconnect();
     }
 
-    die "ERROR: Did not find a DOI prefix in $latest\n\n";
+    unless ($prefix) {
+
+        my @files = glob($directory . '/doi-registrants-*');
+        my $latest = (reverse sort @files)[0];
+
+        my $file = File::ReadBackwards->new($latest)
+            or die "ERROR: Unable to open DOI file ($latest)\n --> $!\n\n";
+
+        my $line = $file->readline;
+
+        if ($line =~ /^(10.\d+).*$/) {
+            $prefix = $1;
+        }
+        else {
+            die "ERROR: Did not find a DOI prefix in $latest\n\n";
+        }
+    }
+
+    # cannot simply use ceil as want 10.55000 to also go to 10.56000
+    $prefix = $prefix * 100;
+    $prefix = $prefix + 1;
+    $prefix = floor($prefix);
+    $prefix = $prefix / 100;
+
+    return $prefix;
 }
 
 sub queryDisambiguatedTitles {
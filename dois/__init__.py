@@ -0,0 +1 @@
+# DOI prefix registrant task (see __main__.py for the pipeline runner)
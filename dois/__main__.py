@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+
+# Runs the DOI scripts in a single process sharing one Wikipedia login:
+#   python3 -m dois run [retrieve options]     = retrieve, upload & compare
+#                                                (extracting the dump prefixes first with --titles-db)
+#   python3 -m dois <stage> [stage options]    = a single stage
+# The registrant rows are passed from retrieve to upload in memory as each
+# block is retrieved, so subpages are saved while retrieve is still running.
+
+import importlib.util
+import os
+import sys
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# stages import the shared code as they do when run directly
+
+sys.path.insert(0, DIRECTORY)
+
+#
+# Configuration
+#
+
+STAGES = {
+    'retrieve': 'dois-retrieve.py',
+    'upload': 'dois-upload.py',
+    'compare': 'dois-compare.py',
+    'prior': 'dois-prior.py',
+    'dump': 'dois-dump.py',
+}
+
+#
+# Functions
+#
+
+def loadStage(name):
+
+    # Load one of the DOI scripts as a module (registered so its functions
+    # can be pickled for worker processes)
+
+    filename = os.path.join(DIRECTORY, STAGES[name])
+    spec = importlib.util.spec_from_file_location('dois_' + name, filename)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+
+    return module
+
+
+def run(arguments):
+
+    # Run retrieve, upload & compare with a single login (extracting the
+    # dump prefixes first if the title database is used)
+
+    from common import METRICS, getSite, getSnapshot, importSnapshots, latestSnapshots, openStore
+
+    retrieve = loadStage('retrieve')
+    upload = loadStage('upload')
+    compare = loadStage('compare')
+
+    resume, refresh, ttl, profile, titles, harvest = retrieve.getOptions(arguments)
+
+    METRICS.start(retrieve.METRICSDIR, 'run')
+    if profile:
+        METRICS.profile(retrieve.PROFILEDIR)
+
+    # the title database is answered from the dump prefixes (extracted before
+    # logging in as the dump processes are forked)
+
+    if titles:
+        dump = loadStage('dump')
+        found = dump.findDump(dump.DUMPS)
+        if found is None:
+            sys.stderr.write('WARNING: no enwiki-*-pages-articles dump in ' + dump.DUMPS + ', prefixes will be queried\n')
+        elif not os.path.exists(dump.STORAGE + found[1]):
+            dump.extractDump(found[0], dump.STORAGE + found[1], dump.WORKERS)
+
+    site = getSite(retrieve.BOTINFO)
+    email = retrieve.getEmail(retrieve.EMAILINFO)
+
+    # subpages are saved as their blocks are retrieved (the summary page last)
+
+    stream = upload.UploadStream(site)
+    filename, rows = retrieve.retrieve(site, email, resume, refresh, ttl, titles, harvest, stream.add)
+
+    upload.upload(site, filename, rows, stream)
+
+    store = openStore(compare.STORE)
+    importSnapshots(store, compare.DIRECTORY)
+    snapshot = getSnapshot(filename)
+    prior = latestSnapshots(store, 1, snapshot)
+    if prior:
+        compare.compare(site, store, snapshot, prior[0])
+    else:
+        print('No prior snapshot to compare with')
+    store.close()
+
+    METRICS.write(retrieve.METRICSDIR, 'run')
+    METRICS.dump('run')
+
+    return
+
+
+def usage():
+
+    print('python3 -m dois {run|' + '|'.join(STAGES) + '} [options]')
+    print('  where run = retrieve, upload & compare in one process (takes the retrieve options)')
+    print('              with --titles-db the dump prefixes are extracted first if not already')
+    print('        use <stage> -h for the options of each stage')
+
+    return
+
+#
+# Main
+#
+
+if len(sys.argv) < 2 or sys.argv[1] not in ('run', *STAGES):
+    usage()
+    sys.exit(2)
+
+if sys.argv[1] == 'run':
+    run(sys.argv[2:])
+else:
+    loadStage(sys.argv[1]).main(sys.argv[2:])
@@ -0,0 +1,773 @@
+#!/usr/bin/python3
+
+# Code shared by the DOI scripts
+
+import contextlib
+import cProfile
+import csv
+import glob
+import html
+import json
+import os
+import pstats
+import random
+import re
+import requests
+import resource
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from mwclient import Site
+from mwclient.errors import APIError, MaximumRetriesExceeded
+from requests.adapters import HTTPAdapter
+from urllib.parse import parse_qs, unquote, urlparse
+from urllib3.util.request import ACCEPT_ENCODING
+
+#
+# Configuration
+#
+
+USERAGENT = 'JL-Bot/0.0 (https://en.wikipedia.org/wiki/User_talk:JL-Bot{})'     # {} takes the mailto address
+WIKIPEDIA = urlparse(os.environ.get('DOIS_WIKIPEDIA_URL', 'https://en.wikipedia.org'))     # override for testing
+
+TABLES = [
+    '''
+    CREATE TABLE IF NOT EXISTS snapshots (
+        snapshot TEXT PRIMARY KEY,
+        created  TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS registrants (
+        snapshot            TEXT,
+        prefix              TEXT,
+        number              INTEGER,
+        crossrefRegistrant  TEXT,
+        wikipediaRegistrant TEXT,
+        crossrefTarget      TEXT,
+        wikipediaTarget     TEXT,
+        PRIMARY KEY (snapshot, prefix)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS registrantsNumber ON registrants (snapshot, number)',
+]
+
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)     # request latency histogram (seconds)
+PROFILESITES = 25          # allocation sites & functions listed per profiled phase
+RETRIES = 5                # attempts for transient errors (timeouts, 429, 5xx, lag)
+BACKOFF = 2                # seconds doubled each attempt for the most waited (up to 4 after the first, full jitter)
+BACKOFFMAX = 120           # most seconds waited between attempts
+SITERETRIES = 0            # mwclient's own retries (left to retry so backoff is not stacked)
+POOLSIZE = 10              # keep-alive connections per host held by a session
+QUERYSIZE = 50             # titles per Wikipedia query (500 with apihighlimits)
+QUERYSIZEBOT = 500
+FLUSHINTERVAL = int(os.environ.get('DOIS_METRICS_INTERVAL', '0'))     # seconds between metric flushes (0 = end of run only)
+
+#
+# Classes
+#
+
+class DeferredQueue:
+
+    # Calls that still failed after retrying. Each is called once more (so
+    # retrying again) at the end of the phase when the upstream problem may
+    # have cleared & whatever fails again is reported rather than ending the
+    # run.
+
+    def __init__(self, name):
+        self.lock = threading.Lock()
+        self.name = name
+        self.items = []
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, key, error, function, *args):
+
+        # Defer a call that failed
+
+        sys.stderr.write('WARNING: deferring ' + self.name + ' ' + str(key) + ': ' + describeError(error) + '\n')
+        METRICS.count('deferred')
+
+        with self.lock:
+            self.items.append((key, function, args))
+
+    def run(self):
+
+        # Retry the deferred calls returning the results & errors by key
+
+        results = {}
+        errors = {}
+
+        with self.lock:
+            items = self.items
+            self.items = []
+
+        if items:
+            print('Retrying', len(items), 'deferred', self.name, '...')
+
+        for key, function, args in items:
+            try:
+                results[key] = function(*args)
+            except Exception as e:
+                errors[key] = e
+                sys.stderr.write('ERROR: ' + self.name + ' ' + str(key) + ' failed: ' + describeError(e) + '\n')
+
+        METRICS.count('deferred_failures', len(errors))
+
+        return results, errors
+
+
+class Metrics:
+
+    # Counters, request latency histograms & phase timings for a run. A single
+    # instance (METRICS) is shared by the scripts & written at the end of the
+    # run as a JSON summary & a Prometheus textfile (optionally also flushed
+    # every FLUSHINTERVAL seconds while running). When profiling, each phase
+    # is also run under cProfile & tracemalloc.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.phases = {}
+        self.started = time.time()
+        self.stopped = threading.Event()
+        self.flusher = None
+        self.profiling = None
+        self.profiles = {}
+        self.profiled = False
+
+    def count(self, name, amount=1, endpoint=''):
+
+        # Add to a counter
+
+        with self.lock:
+            key = (name, endpoint)
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def dump(self, stage):
+
+        # Write the CPU profile (.prof) & a report of the top functions,
+        # allocation sites & peak memory (.txt) for each profiled phase
+
+        if not self.profiling:
+            return
+
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+
+        try:
+            os.makedirs(self.profiling, exist_ok=True)
+
+            for name, profile in self.profiles.items():
+
+                filename = self.profiling + '/' + stage + '-' + stamp + '-' + name
+                profile['profile'].dump_stats(filename + '.prof')
+
+                with open(filename + '.txt', 'w') as file:
+                    file.write(f"{stage} {name}\n\n")
+                    file.write(f"peak traced memory: {profile['peak'] / 1048576:.1f} MB\n")
+                    file.write(f"peak RSS:           {profile['rss'] / 1024:.1f} MB\n\n")
+                    file.write('top allocation sites (net bytes allocated during the phase):\n\n')
+                    sites = sorted(profile['sites'].items(), key=lambda item: item[1], reverse=True)
+                    for site, size in sites[:PROFILESITES]:
+                        file.write(f'{size:>14,}  {site}\n')
+                    file.write('\n')
+                    stats = pstats.Stats(profile['profile'], stream=file)
+                    stats.sort_stats('cumulative').print_stats(PROFILESITES)
+
+            print('Profiles written to', self.profiling)
+
+        except OSError:
+            traceback.print_exc()
+
+        return
+
+    def items(self, name, amount):
+
+        # Add to the items processed by a phase
+
+        with self.lock:
+            self.phases.setdefault(name, {'seconds': 0.0, 'items': 0})['items'] += amount
+
+    @contextlib.contextmanager
+    def phase(self, name):
+
+        # Time a phase of the run (& profile it if enabled). Only the calling
+        # thread is seen by cProfile while tracemalloc sees all threads, so
+        # phases entered on other threads (which may overlap those of the main
+        # thread) are timed but not profiled.
+
+        profile = None
+
+        if self.profiling and not self.profiled and threading.current_thread() is threading.main_thread():
+            self.profiled = True
+            profile = self.profiles.setdefault(name, {'profile': cProfile.Profile(), 'sites': {}, 'peak': 0, 'rss': 0})
+            tracemalloc.reset_peak()
+            before = takeSnapshot()
+            profile['profile'].enable()
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.phases.setdefault(name, {'seconds': 0.0, 'items': 0})['seconds'] += time.perf_counter() - start
+
+            if profile:
+                profile['profile'].disable()
+                profile['peak'] = max(profile['peak'], tracemalloc.get_traced_memory()[1])
+                profile['rss'] = max(profile['rss'], resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+                for stat in takeSnapshot().compare_to(before, 'lineno'):
+                    if stat.size_diff > 0:
+                        site = str(stat.traceback[0])
+                        profile['sites'][site] = profile['sites'].get(site, 0) + stat.size_diff
+                self.profiled = False
+
+    def profile(self, directory):
+
+        # Profile each phase from now on writing the results to directory
+
+        self.profiling = directory
+        tracemalloc.start()
+
+        return
+
+    def request(self, endpoint, seconds, size):
+
+        # Record a request's latency & response size
+
+        with self.lock:
+            for name, amount in (('requests', 1), ('response_bytes', size)):
+                key = (name, endpoint)
+                self.counters[key] = self.counters.get(key, 0) + amount
+            histogram = self.histograms.setdefault(endpoint, {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0})
+            for index, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram['buckets'][index] += 1
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+
+    def start(self, directory, stage):
+
+        # Flush the metrics periodically (if FLUSHINTERVAL is set)
+
+        if FLUSHINTERVAL <= 0 or self.flusher:
+            return
+
+        def flush():
+            while not self.stopped.wait(FLUSHINTERVAL):
+                self.write(directory, stage)
+
+        self.flusher = threading.Thread(target=flush, daemon=True)
+        self.flusher.start()
+
+    def summary(self, stage):
+
+        # Return the metrics as a dictionary
+
+        with self.lock:
+            counters = {}
+            for (name, endpoint), value in sorted(self.counters.items()):
+                counters.setdefault(name, {})[endpoint or 'total'] = value
+
+            latency = {}
+            for endpoint, histogram in sorted(self.histograms.items()):
+                latency[endpoint] = {
+                    'count': histogram['count'],
+                    'sum': round(histogram['sum'], 6),
+                    'mean': round(histogram['sum'] / histogram['count'], 6),
+                    'buckets': dict(zip((str(bound) for bound in BUCKETS), histogram['buckets'])),
+                }
+
+            phases = {}
+            for name, phase in self.phases.items():
+                rate = phase['items'] / phase['seconds'] if phase['seconds'] else 0
+                phases[name] = {'seconds': round(phase['seconds'], 6), 'items': phase['items'], 'rate': round(rate, 3)}
+
+        return {
+            'stage': stage,
+            'started': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+            'elapsed': round(time.time() - self.started, 3),
+            'counters': counters,
+            'latency': latency,
+            'phases': phases,
+        }
+
+    def textfile(self, stage):
+
+        # Return the metrics in the Prometheus text exposition format
+
+        summary = self.summary(stage)
+        lines = []
+
+        for name, values in summary['counters'].items():
+            metric = 'dois_' + name + '_total'
+            lines.append('# TYPE ' + metric + ' counter')
+            for endpoint, value in values.items():
+                if endpoint == 'total':
+                    lines.append(f'{metric}{{stage="{stage}"}} {value}')
+                else:
+                    lines.append(f'{metric}{{stage="{stage}",endpoint="{endpoint}"}} {value}')
+
+        if summary['latency']:
+            lines.append('# TYPE dois_request_seconds histogram')
+            for endpoint, histogram in summary['latency'].items():
+                labels = f'stage="{stage}",endpoint="{endpoint}"'
+                for bound, value in histogram['buckets'].items():
+                    lines.append(f'dois_request_seconds_bucket{{{labels},le="{bound}"}} {value}')
+                lines.append(f'dois_request_seconds_bucket{{{labels},le="+Inf"}} {histogram["count"]}')
+                lines.append(f'dois_request_seconds_sum{{{labels}}} {histogram["sum"]}')
+                lines.append(f'dois_request_seconds_count{{{labels}}} {histogram["count"]}')
+
+        for name, unit in (('seconds', 'seconds'), ('items', 'items'), ('rate', 'items_per_second')):
+            if summary['phases']:
+                lines.append('# TYPE dois_phase_' + unit + ' gauge')
+            for phase, values in summary['phases'].items():
+                lines.append(f'dois_phase_{unit}{{stage="{stage}",phase="{phase}"}} {values[name]}')
+
+        lines.append('# TYPE dois_run_elapsed_seconds gauge')
+        lines.append(f'dois_run_elapsed_seconds{{stage="{stage}"}} {summary["elapsed"]}')
+        lines.append('# TYPE dois_run_timestamp_seconds gauge')
+        lines.append(f'dois_run_timestamp_seconds{{stage="{stage}"}} {int(time.time())}')
+
+        return summary, '\n'.join(lines) + '\n'
+
+    def write(self, directory, stage):
+
+        # Write metrics-<stage>.json & metrics-<stage>.prom (replaced atomically
+        # so the Prometheus textfile collector never reads a partial file)
+
+        summary, text = self.textfile(stage)
+
+        try:
+            os.makedirs(directory, exist_ok=True)
+            filename = directory + '/metrics-' + stage
+            with open(filename + '.json.tmp', 'w') as file:
+                json.dump(summary, file, indent=2)
+            os.replace(filename + '.json.tmp', filename + '.json')
+            with open(filename + '.prom.tmp', 'w') as file:
+                file.write(text)
+            os.replace(filename + '.prom.tmp', filename + '.prom')
+
+        except OSError:
+            traceback.print_exc()
+
+        return
+
+
+METRICS = Metrics()
+RESPONSES = threading.local()     # Retry-After of the last Wikipedia response on each thread
+
+
+class TransientError(Exception):
+
+    # A failure that is worth retrying (with the server's Retry-After if any)
+
+    def __init__(self, message, delay=None):
+        super().__init__(message)
+        self.delay = delay
+
+#
+# Functions
+#
+
+def checkTransient(error):
+
+    # Return whether an error is transient & the Retry-After delay (if given)
+
+    if isinstance(error, TransientError):
+        return True, parseRetryAfter(error.delay)
+
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True, None
+
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        if status == 429 or status >= 500:
+            return True, parseRetryAfter(error.response.headers.get('retry-after'))
+
+    if isinstance(error, APIError) and error.code:
+        if error.code in ('maxlag', 'ratelimited', 'readonly') or error.code.startswith('internal_api_error'):
+            return True, None
+
+    # raised by mwclient on lag without its own retries (so the wait is taken
+    # from the response that caused it)
+
+    if isinstance(error, MaximumRetriesExceeded):
+        return True, parseRetryAfter(getattr(RESPONSES, 'delay', None))
+
+    return False, None
+
+
+def describeError(error):
+
+    # One line description of an error
+
+    return type(error).__name__ + ': ' + str(error)
+
+
+def findSnapshots(directory):
+
+    # Find the registrant snapshots sorted oldest to newest
+
+    files = glob.glob(directory + '/doi-registrants-*')
+
+    return sorted(files)
+
+
+def findTarget(text):
+
+    # Find the target of a redirect (normalized)
+
+    match = re.search(r'^\s*#redirect\s*:?\s*\[\[\s*:?\s*(.+?)\s*(?:\]|(?<!&)#|\n|\|)', text, re.IGNORECASE)
+    if match:
+        target = normalizeTarget(match.group(1))
+    else:
+        target = 'NONE'
+
+    return target
+
+
+def getSite(filename):
+
+    # Log in to Wikipedia using the bot userinfo
+
+    userinfo = getUserInfo(filename)
+
+    try:
+        site = retry(Site, WIKIPEDIA.netloc, scheme=WIKIPEDIA.scheme, pool=openSession(), max_retries=SITERETRIES)
+        site.connection.hooks['response'].append(recordResponse)
+        retry(site.login, userinfo['username'], userinfo['password'])
+    except Exception:
+        traceback.print_exc()
+        sys.exit(1)
+
+    return site
+
+
+def getSnapshot(filename):
+
+    # Snapshot name (YYYYMMDD) from a registrant file name
+
+    return os.path.basename(filename).replace('doi-registrants-', '')
+
+
+def getUserInfo(filename):
+
+    # Read in bot userinfo
+
+    userinfo = {}
+
+    try:
+        with open(filename, 'r') as file:
+            for line in file:
+                match = re.search(r'^USERNAME = (.+?)\s*$', line)
+                if match:
+                    userinfo['username'] = match.group(1)
+                match = re.search(r'^PASSWORD = (.+?)\s*$', line)
+                if match:
+                    userinfo['password'] = match.group(1)
+
+        if 'username' not in userinfo:
+            sys.stderr.write('ERROR: username not found\n')
+            sys.exit(1)
+
+        if 'password' not in userinfo:
+            sys.stderr.write('ERROR: password not found\n')
+            sys.exit(1)
+
+    except Exception:
+        traceback.print_exc()
+        sys.exit(1)
+
+    return userinfo
+
+
+def importSnapshots(connection, directory):
+
+    # Add any dated registrant files missing from the store (only needed for
+    # files written before the store existed)
+
+    stored = {row[0] for row in connection.execute('SELECT snapshot FROM snapshots')}
+
+    for filename in findSnapshots(directory):
+        snapshot = getSnapshot(filename)
+        if re.search(r'^\d{8}$', snapshot) and snapshot not in stored:
+            print('Importing', os.path.basename(filename), '...')
+            saveSnapshot(connection, snapshot, readSnapshot(filename))
+
+    return
+
+
+def latestSnapshots(connection, count, before=None):
+
+    # Return the names of the latest snapshots (newest first), optionally only
+    # those before a given snapshot
+
+    if before is None:
+        before = '99999999'
+
+    results = connection.execute(
+        'SELECT snapshot FROM snapshots WHERE snapshot < ? ORDER BY snapshot DESC LIMIT ?', (before, count)
+    )
+
+    return [row[0] for row in results]
+
+
+def loadSnapshot(connection, snapshot):
+
+    # Return the rows of a stored snapshot in numeric prefix order
+
+    results = connection.execute('''
+        SELECT prefix, crossrefRegistrant, wikipediaRegistrant, crossrefTarget, wikipediaTarget
+        FROM registrants
+        WHERE snapshot = ?
+        ORDER BY number
+    ''', (snapshot,))
+
+    return [tuple(row) for row in results]
+
+
+def normalizeTarget(target):
+
+    # Normalize a redirect target as citations-parse.pl stores it in the dump
+    # title database, so targets compare the same whichever source they are
+    # taken from
+
+    target = unquote(html.unescape(target)).replace('_', ' ')
+    target = re.sub(r' {2,}', ' ', target)
+    target = re.sub(r'^ | $', '', target)
+
+    return target[:1].upper() + target[1:]
+
+
+def openSession(email=None, size=POOLSIZE):
+
+    # HTTP session shared by the requests to a service. Connections are kept
+    # alive & pooled (at most size per host, further requests wait for one),
+    # responses are compressed with whatever urllib3 can decode (brotli only
+    # if installed) and with an email the User-Agent & mailto parameter ask
+    # for the polite pool.
+
+    session = requests.Session()
+
+    adapter = HTTPAdapter(pool_maxsize=size, pool_block=True)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+    session.headers['User-Agent'] = USERAGENT.format('; mailto:' + email if email else '')
+    if email:
+        session.params['mailto'] = email
+
+    return session
+
+
+def openStore(filename):
+
+    # Open (creating if needed) the registrant snapshot store
+
+    try:
+        connection = sqlite3.connect(filename)
+        for table in TABLES:
+            connection.execute(table)
+        connection.commit()
+
+    except sqlite3.Error:
+        traceback.print_exc()
+        sys.exit(1)
+
+    return connection
+
+
+def parsePage(title, text):
+
+    # Extract the registrant (DOI prefix pages only) & redirect target
+
+    target = findTarget(text)
+
+    if not re.search(r'^10\.\d+$', title):
+        return ('NONE', target)
+
+    match = re.search(r'{{\s*(?:Template\s*:\s*)?(?:R[ _]+from[ _]+DOI[ _]+prefix|R[ _]+from[ _]+DOI)\s*\|\s*registrant\s*=\s*(.+?)\s*[\|\}]', text, re.IGNORECASE)
+    if match:
+        registrant = match.group(1)
+    else:
+        match = re.search('registrant', text, re.IGNORECASE)
+        if match:
+            sys.stderr.write('ERROR: registrant not detected for ' + title + '\n')
+            sys.exit(1)
+        registrant = 'NONE'
+
+    return (registrant, target)
+
+
+def parseRetryAfter(value):
+
+    # Seconds from a Retry-After value (seconds or an HTTP date)
+
+    if value is None:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def queryPages(site, titles, parameters):
+
+    # Run a multi-title Wikipedia query returning the page items keyed by the
+    # requested titles (a copy each, as several may be normalized to the same
+    # page, & titles without an item left out). Continuations are followed
+    # from the base request & their items merged (failures are raised).
+
+    normalized = {}
+    pages = {}
+    results = {}
+
+    request = dict(parameters, titles='|'.join(titles))
+    parameters = request
+
+    while True:
+
+        response = retry(site.api, 'query', **parameters)
+        query = response.get('query', {})
+
+        for item in query.get('normalized', []):
+            normalized[item['from']] = item['to']
+
+        for item in query.get('pages', {}).values():
+            pages.setdefault(item['title'], {}).update(item)
+
+        # large responses are split across continuations
+
+        if 'continue' not in response:
+            break
+        parameters = dict(request, **response['continue'])
+
+    for title in titles:
+        key = normalized.get(title, title)
+        if key in pages:
+            results[title] = dict(pages[key])
+
+    return results
+
+
+def querySize(site):
+
+    # Determine the number of titles allowed per query
+
+    if 'apihighlimits' in site.rights:
+        return QUERYSIZEBOT
+
+    return QUERYSIZE
+
+
+def readSnapshot(filename):
+
+    # Read a registrant snapshot returning a list of rows
+    # prefix, crossref registrant, wikipedia registrant, crossref target, wikipedia target
+
+    try:
+        with open(filename, 'r') as file:
+            rows = [tuple(line) for line in csv.reader(file, delimiter='\t')]
+
+    except Exception:
+        traceback.print_exc()
+        sys.exit(1)
+
+    return rows
+
+
+def recordResponse(response, *args, **kwargs):
+
+    # Record each Wikipedia API response in the metrics by action & keep the
+    # wait it asks for (Retry-After or the database lag) for the thread
+
+    body = response.request.body or ''
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', 'replace')
+
+    parameters = parse_qs(urlparse(response.request.url).query)
+    parameters.update(parse_qs(body))
+    action = parameters.get('action', ['unknown'])[0]
+
+    METRICS.request('wikipedia-' + action, response.elapsed.total_seconds(), len(response.content))
+
+    RESPONSES.delay = response.headers.get('retry-after') or response.headers.get('x-database-lag')
+
+    return
+
+
+def retry(function, *args, **kwargs):
+
+    # Call function retrying transient errors up to RETRIES times. Waits use
+    # exponential backoff with full jitter unless the server gave Retry-After.
+
+    for attempt in range(1, RETRIES + 1):
+        try:
+            return function(*args, **kwargs)
+        except Exception as e:
+            transient, delay = checkTransient(e)
+            if not transient or attempt == RETRIES:
+                raise
+            if delay is None:
+                delay = random.uniform(0, min(BACKOFFMAX, BACKOFF * 2 ** attempt))
+            else:
+                delay = min(delay, BACKOFFMAX) + random.uniform(0, 1)
+            sys.stderr.write(f'WARNING: {describeError(e)} (attempt {attempt}), retrying in {delay:.1f}s\n')
+            METRICS.count('retries')
+            METRICS.count('retry_wait_seconds', delay)
+            time.sleep(delay)
+
+
+def revisionText(revision):
+
+    # Text of a revision returned with rvslots=main (or without slots)
+
+    if 'slots' in revision:
+        return revision['slots']['main']['*']
+
+    return revision['*']
+
+
+def saveSnapshot(connection, snapshot, rows):
+
+    # Save (replacing any existing) snapshot rows to the store
+
+    try:
+        connection.execute('DELETE FROM registrants WHERE snapshot = ?', (snapshot,))
+        connection.executemany(
+            'INSERT INTO registrants VALUES (?, ?, ?, ?, ?, ?, ?)',
+            ((snapshot, row[0], int(row[0].replace('10.', '')), *row[1:5]) for row in rows)
+        )
+        connection.execute(
+            "INSERT OR REPLACE INTO snapshots VALUES (?, datetime('now'))", (snapshot,)
+        )
+        connection.commit()
+
+    except sqlite3.Error:
+        traceback.print_exc()
+        sys.exit(1)
+
+    return
+
+
+def takeSnapshot():
+
+    # Take a tracemalloc snapshot excluding tracemalloc itself
+
+    return tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
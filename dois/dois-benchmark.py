@@ -0,0 +1,715 @@
+#!/usr/bin/python3
+
+# Offline benchmark for the DOI scripts. Local stand-ins for the Crossref and
+# MediaWiki APIs are started, a synthetic dataset is generated, and each stage
+# (and the single process pipeline) is timed against them. Results are
+# written as JSON so runs can be compared.
+
+import getopt
+import hashlib
+import json
+import os
+import random
+import re
+import shlex
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+#
+# Configuration
+#
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+STAGES = ['dois-retrieve.py', 'dois-upload.py', 'dois-compare.py', 'dois-prior.py']
+NUMBERS = range(1000, 80000)    # prefix numbers the scripts accept (10.8xxxx, 10.9xxxx & longer are test prefixes)
+LISTLIMIT = 5000                # list & generator limit=max (with apihighlimits)
+CONTENTLIMIT = 50               # pages given content per request in a generator batch
+DUMPAGE = 1                     # days before the run the stand-in dump was taken
+
+DEFAULTS = {
+    'prefixes': 10000,
+    'seed': 1,
+    'retrieve': '',             # extra dois-retrieve.py options (e.g. --titles-db --harvest)
+    'latency': 0.0,             # seconds added to every response
+    'limit': 50,                # x-rate-limit-limit
+    'interval': 1,              # x-rate-limit-interval (seconds)
+    'concurrency': 5,           # x-concurrency-limit
+}
+
+#
+# Classes
+#
+
+class Counters:
+
+    # Request counters shared by the stand-in servers
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def add(self, name, amount=1):
+        with self.lock:
+            self.values[name] = self.values.get(name, 0) + amount
+
+    def reset(self):
+        with self.lock:
+            self.values = {}
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values)
+
+
+class CrossrefHandler(BaseHTTPRequestHandler):
+
+    # Stand-in for api.crossref.org (/members/ & /prefixes/<prefix>)
+
+    dataset = None
+    settings = None
+    counters = None
+    window = []
+    lock = threading.Lock()
+
+    def do_GET(self):
+
+        url = urlparse(self.path)
+        parameters = {key: value[0] for key, value in parse_qs(url.query).items()}
+
+        self.counters.add('crossref')
+        self.checkRate()
+
+        if self.settings['latency']:
+            time.sleep(self.settings['latency'])
+
+        if url.path.rstrip('/') == '/members':
+            self.members(parameters)
+        elif url.path.startswith('/prefixes/'):
+            self.prefix(unquote(url.path[len('/prefixes/'):]))
+        else:
+            self.reply(404, {'status': 'error'})
+
+    def checkRate(self):
+
+        # Count requests exceeding the advertised rate limit
+
+        now = time.monotonic()
+        interval = self.settings['interval']
+
+        with self.lock:
+            while self.window and self.window[0] <= now - interval:
+                self.window.pop(0)
+            self.window.append(now)
+            if len(self.window) > self.settings['limit']:
+                self.counters.add('crossref-over-limit')
+
+    def members(self, parameters):
+
+        members = self.dataset['members']
+        rows = int(parameters.get('rows', 20))
+
+        if 'cursor' in parameters:
+            cursor = parameters['cursor']
+            offset = 0 if cursor == '*' else int(cursor.split('-')[1])
+        else:
+            offset = int(parameters.get('offset', 0))
+
+        items = [
+            {'id': member['id'], 'primary-name': member['name'], 'prefixes': member['prefixes']}
+            for member in members[offset:offset + rows]
+        ]
+
+        self.reply(200, {'status': 'ok', 'message': {
+            'total-results': len(members),
+            'items': items,
+            'next-cursor': 'cursor-' + str(offset + rows),
+        }})
+
+    def prefix(self, prefix):
+
+        name = self.dataset['owners'].get(prefix)
+
+        if name is None:
+            self.reply(404, {'status': 'error'})
+        else:
+            self.reply(200, {'status': 'ok', 'message': {
+                'name': name,
+                'prefix': 'https://id.crossref.org/prefix/' + prefix,
+            }})
+
+    def reply(self, status, data):
+
+        body = json.dumps(data).encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('x-rate-limit-limit', str(self.settings['limit']))
+        self.send_header('x-rate-limit-interval', str(self.settings['interval']) + 's')
+        self.send_header('x-concurrency-limit', str(self.settings['concurrency']))
+        self.end_headers()
+        self.wfile.write(body)
+
+        self.counters.add('crossref-bytes', len(body))
+
+    def log_message(self, format, *args):
+        return
+
+
+class WikipediaHandler(BaseHTTPRequestHandler):
+
+    # Stand-in for the MediaWiki API (login, query & edit). Queries support
+    # titles, list=allpages, list=recentchanges (of the edits made) &
+    # generator=embeddedin.
+
+    pages = None
+    settings = None
+    counters = None
+    lock = threading.Lock()
+    revision = [1]
+    changes = []
+
+    def do_GET(self):
+        self.process(parse_qs(urlparse(self.path).query))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.process(parse_qs(self.rfile.read(length).decode('utf-8'), keep_blank_values=True))
+
+    def process(self, parameters):
+
+        parameters = {key: value[0] for key, value in parameters.items()}
+        action = parameters.get('action')
+
+        self.counters.add('wikipedia')
+        if self.settings['latency']:
+            time.sleep(self.settings['latency'])
+
+        if action == 'login':
+            self.reply({'login': {'result': 'Success', 'lgusername': parameters.get('lgname')}})
+        elif action == 'edit':
+            self.counters.add('wikipedia-edits')
+            self.reply(self.edit(parameters))
+        elif action == 'query':
+            self.reply(self.query(parameters))
+        else:
+            self.reply({'error': {'code': 'badvalue', 'info': 'Unsupported action'}})
+
+    def allPages(self, parameters):
+
+        namespace = int(parameters.get('apnamespace', 0))
+        prefix = parameters.get('apprefix', '')
+        limit = listLimit(parameters.get('aplimit'))
+
+        titles = sorted(
+            title for title in self.pages
+            if namespaceOf(title) == namespace and title.startswith(prefix) and title >= parameters.get('apcontinue', '')
+        )
+
+        items = [{'pageid': self.pages[title]['pageid'], 'ns': namespace, 'title': title} for title in titles[:limit]]
+
+        if len(titles) > limit:
+            return items, {'apcontinue': titles[limit]}
+
+        return items, None
+
+    def edit(self, parameters):
+
+        title = normalize(parameters['title'])
+        text = parameters.get('text', '').rstrip()
+        timestamp = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+
+        with self.lock:
+            if title in self.pages and self.pages[title]['text'] == text:
+                return {'edit': {'result': 'Success', 'title': title, 'nochange': ''}}
+            self.revision[0] += 1
+            self.changes.append(dict(change(self.pages.get(title), text), title=title, ns=namespaceOf(title), timestamp=timestamp))
+            self.pages[title] = {'text': text, 'revid': self.revision[0], 'pageid': self.revision[0]}
+
+        return {'edit': {
+            'result': 'Success',
+            'title': title,
+            'newrevid': self.revision[0],
+            'newtimestamp': timestamp,
+        }}
+
+    def embeddedIn(self, parameters):
+
+        # Pages transcluding the template in batches of the limit, with content
+        # for CONTENTLIMIT of the batch at a time (continuing with rvcontinue &
+        # the batch's geicontinue as MediaWiki does)
+
+        template = '{{' + parameters['geititle'].split(':', 1)[-1]
+        namespace = int(parameters.get('geinamespace', 0))
+        limit = listLimit(parameters.get('geilimit'))
+        content = 'revisions' in parameters.get('prop', '').split('|')
+
+        titles = sorted(title for title, page in self.pages.items() if namespaceOf(title) == namespace and template in page['text'])
+
+        start = int(parameters.get('geicontinue', 0))
+        offset = int(parameters.get('rvcontinue', 0))
+        batch = titles[start:start + limit]
+        pages = {}
+
+        for index, title in enumerate(batch):
+            page = self.pages[title]
+            item = {'pageid': page['pageid'], 'ns': namespace, 'title': title}
+            if content and offset <= index < offset + CONTENTLIMIT:
+                item['revisions'] = [{'revid': page['revid'], 'slots': {'main': {'contentmodel': 'wikitext', '*': page['text']}}}]
+            pages[str(page['pageid'])] = item
+
+        if content and offset + CONTENTLIMIT < len(batch):
+            return pages, {'geicontinue': str(start), 'rvcontinue': str(offset + CONTENTLIMIT)}
+        if start + limit < len(titles):
+            return pages, {'geicontinue': str(start + limit)}
+
+        return pages, None
+
+    def query(self, parameters):
+
+        query = {}
+        meta = parameters.get('meta', '').split('|')
+
+        if 'siteinfo' in meta:
+            query['general'] = {'generator': 'MediaWiki 1.43.0', 'sitename': 'Benchmark'}
+            query['namespaces'] = {
+                '0': {'id': 0, '*': ''},
+                '2': {'id': 2, '*': 'User'},
+                '10': {'id': 10, '*': 'Template'},
+            }
+        if 'userinfo' in meta:
+            query['userinfo'] = {'id': 1, 'name': 'JL-Bot', 'groups': ['bot'], 'rights': ['read', 'edit', 'apihighlimits']}
+        if 'tokens' in meta:
+            query['tokens'] = {'logintoken': 'login+\\', 'csrftoken': 'csrf+\\'}
+
+        more = None
+
+        if parameters.get('list') == 'allpages':
+            query['allpages'], more = self.allPages(parameters)
+        elif parameters.get('list') == 'recentchanges':
+            query['recentchanges'], more = self.recentChanges(parameters)
+
+        if parameters.get('generator') == 'embeddedin':
+            query['pages'], more = self.embeddedIn(parameters)
+        elif 'titles' in parameters:
+            query.update(self.titles(parameters))
+
+        if more:
+            more['continue'] = '-||'
+            return {'continue': more, 'query': query}
+
+        return {'batchcomplete': '', 'query': query}
+
+    def recentChanges(self, parameters):
+
+        # The edits made (newest first) filtered as requested
+
+        types = parameters.get('rctype', 'edit|new|log').split('|')
+        limit = listLimit(parameters.get('rclimit'))
+
+        with self.lock:
+            changes = [
+                item for item in reversed(self.changes)
+                if item['type'] in types
+                and ('rcnamespace' not in parameters or item['ns'] == int(parameters['rcnamespace']))
+                and ('rctag' not in parameters or parameters['rctag'] in item['tags'])
+                and item['timestamp'] >= parameters.get('rcend', '')
+            ]
+
+        start = int(parameters.get('rccontinue', 0))
+
+        if start + limit < len(changes):
+            return changes[start:start + limit], {'rccontinue': str(start + limit)}
+
+        return changes[start:], None
+
+    def titles(self, parameters):
+
+        prop = parameters.get('prop', '').split('|')
+        rvprop = parameters.get('rvprop', 'ids|timestamp').split('|')
+
+        normalized = []
+        pages = {}
+        missing = -1
+
+        for title in parameters['titles'].split('|'):
+
+            name = normalize(title)
+            if name != title:
+                normalized.append({'from': title, 'to': name})
+
+            namespace = namespaceOf(name)
+            page = self.pages.get(name)
+
+            if page is None:
+                pages[str(missing)] = {'ns': namespace, 'title': name, 'missing': ''}
+                missing -= 1
+                continue
+
+            item = {'pageid': page['pageid'], 'ns': namespace, 'title': name}
+
+            if 'info' in prop:
+                item.update({
+                    'lastrevid': page['revid'],
+                    'length': len(page['text']),
+                    'touched': '2024-01-01T00:00:00Z',
+                    'contentmodel': 'wikitext',
+                    'protection': [],
+                })
+                if page['text'].lower().startswith('#redirect'):
+                    item['redirect'] = ''
+
+            if 'revisions' in prop:
+                revision = {'revid': page['revid'], 'timestamp': '2024-01-01T00:00:00Z'}
+                if 'sha1' in rvprop:
+                    revision['sha1'] = hashlib.sha1(page['text'].encode('utf-8')).hexdigest()
+                if 'content' in rvprop:
+                    revision['slots'] = {'main': {'contentmodel': 'wikitext', '*': page['text']}}
+                item['revisions'] = [revision]
+
+            pages[str(page['pageid'])] = item
+
+        results = {'pages': pages}
+        if normalized:
+            results['normalized'] = normalized
+
+        return results
+
+    def reply(self, data):
+
+        body = json.dumps(data).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+        self.counters.add('wikipedia-bytes', len(body))
+
+    def log_message(self, format, *args):
+        return
+
+#
+# Functions
+#
+
+def change(page, text):
+
+    # Recent change type & tags of saving text over the page (None if new)
+
+    target = findRedirect(text)
+
+    if page is None:
+        return {'type': 'new', 'tags': ['mw-new-redirect'] if target else []}
+
+    prior = findRedirect(page['text'])
+
+    if target and not prior:
+        tags = ['mw-new-redirect']
+    elif prior and not target:
+        tags = ['mw-removed-redirect']
+    elif prior != target:
+        tags = ['mw-changed-redirect-target']
+    else:
+        tags = []
+
+    return {'type': 'edit', 'tags': tags}
+
+
+def findRedirect(text):
+
+    # Target of a redirect (normalized) or None
+
+    match = re.search(r'^\s*#redirect\s*:?\s*\[\[\s*:?\s*(.+?)\s*(?:\]|#|\n|\|)', text, re.IGNORECASE)
+    if not match:
+        return None
+
+    return normalize(match.group(1))
+
+
+def generateDataset(count, seed):
+
+    # Generate a synthetic set of Crossref members & Wikipedia pages. Prefixes
+    # are spread evenly across the valid numbers (so at most len(NUMBERS))
+    # as the scripts treat the others, like Crossref test prefixes, as invalid.
+
+    generator = random.Random(seed)
+
+    members = []
+    owners = {}
+    prefixes = ['10.' + str(NUMBERS[index * len(NUMBERS) // count]) for index in range(count)]
+
+    index = 0
+    while index < len(prefixes):
+        size = generator.choice((1, 1, 1, 2, 3, 5, 20))
+        name = 'Publisher ' + str(len(members) + 1)
+        owned = prefixes[index:index + size]
+        members.append({'id': len(members) + 1, 'name': name, 'prefixes': owned})
+        for prefix in owned:
+            owners[prefix] = name
+        index += size
+
+    # about 1% of prefixes are also claimed by another member (ambiguous)
+
+    for prefix in generator.sample(prefixes, count // 100):
+        generator.choice(members)['prefixes'].append(prefix)
+
+    # Wikipedia pages for about a third of prefixes & half the registrants
+
+    pages = {}
+    revision = 1
+
+    for member in members:
+        if generator.random() < 0.5:
+            if generator.random() < 0.5:
+                text = '#REDIRECT [[' + member['name'] + ' (publisher)]]\n{{R from alternative name}}'
+            else:
+                text = "'''" + member['name'] + "''' is a publisher.\n" + 'Lorem ipsum dolor sit amet. ' * 100
+            pages[member['name']] = {'text': text, 'revid': revision, 'pageid': revision}
+            revision += 1
+
+    for prefix in prefixes:
+        if generator.random() < 0.33:
+            name = owners[prefix]
+            text = '#REDIRECT [[' + name + ']]\n{{R from DOI prefix|registrant=' + name + '}}'
+            pages[prefix] = {'text': text, 'revid': revision, 'pageid': revision}
+            revision += 1
+
+    return {'members': members, 'owners': owners, 'pages': pages, 'revision': revision}
+
+
+def listLimit(value):
+
+    # Items per list query (max is the apihighlimits limit)
+
+    if value is None:
+        return 10
+    if value == 'max':
+        return LISTLIMIT
+
+    return min(int(value), LISTLIMIT)
+
+
+def namespaceOf(title):
+
+    # Namespace number of a stand-in title
+
+    if title.startswith('User:'):
+        return 2
+    if title.startswith('Template:'):
+        return 10
+
+    return 0
+
+
+def normalize(title):
+
+    # MediaWiki title normalization (first letter & underscores)
+
+    title = title.replace('_', ' ').strip()
+
+    return title[:1].upper() + title[1:]
+
+
+def prepareWorking(dataset, directory):
+
+    # Create the working & configuration directories with a prior snapshot
+    # (slightly different from the dataset so compare has work to do), the
+    # dump title database & the DOI prefix pages extracted from the dump (for
+    # --titles-db) as of DUMPAGE days ago
+
+    working = os.path.join(directory, 'working')
+    config = os.path.join(directory, 'config')
+
+    os.makedirs(working + '/Dois')
+    os.makedirs(config)
+
+    with open(config + '/bot-info.txt', 'w') as file:
+        file.write('USERNAME = JL-Bot\nPASSWORD = benchmark\n')
+
+    with open(config + '/email-info.txt', 'w') as file:
+        file.write('EMAIL = benchmark@example.org\n')
+
+    generator = random.Random(0)
+    prior = (date.today() - timedelta(days=30)).strftime('%Y%m%d')
+
+    with open(working + '/Dois/doi-registrants-' + prior, 'w') as file:
+        for prefix in sorted(dataset['owners'], key=lambda prefix: int(prefix[3:])):
+            name = dataset['owners'][prefix]
+            if generator.random() < 0.01:
+                name = 'Renamed ' + name
+            file.write('\t'.join((prefix, name, 'NONE', 'NONE', 'NONE')) + '\n')
+
+    dump = date.today() - timedelta(days=DUMPAGE)
+
+    os.makedirs(working + '/Citations')
+    connection = sqlite3.connect(working + '/Citations/db-titles.sqlite3')
+    connection.execute('CREATE TABLE titles(title TEXT, pageType TEXT, target TEXT, titleType TEXT)')
+    connection.execute('CREATE TABLE revisions(type TEXT, revision TEXT)')
+    connection.execute("INSERT INTO revisions VALUES ('date', ?)", (dump.isoformat(),))
+
+    with open(working + '/Dois/doi-dump-' + dump.strftime('%Y%m%d'), 'w') as file:
+        for title, page in sorted(dataset['pages'].items()):
+            target = findRedirect(page['text'])
+            connection.execute('INSERT INTO titles VALUES (?, ?, ?, ?)', (title, 'REDIRECT' if target else 'NORMAL', target or '', 'NORMAL'))
+            match = re.search(r'\|registrant=(.+?)}}', page['text'])
+            if re.search(r'^10\.\d+$', title) and match:
+                file.write('\t'.join((title, str(page['revid']), match.group(1), target or 'NONE')) + '\n')
+
+    connection.commit()
+    connection.close()
+
+    return working, config
+
+
+def runBenchmark(dataset, settings):
+
+    # Time each stage & then the single process pipeline against the stand-ins
+
+    counters = Counters()
+
+    CrossrefHandler.dataset = dataset
+    CrossrefHandler.settings = settings
+    CrossrefHandler.counters = counters
+    WikipediaHandler.settings = settings
+    WikipediaHandler.counters = counters
+
+    crossref = ThreadingHTTPServer(('127.0.0.1', 0), CrossrefHandler)
+    wikipedia = ThreadingHTTPServer(('127.0.0.1', 0), WikipediaHandler)
+
+    for server in (crossref, wikipedia):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    results = {'stages': {}, 'pipeline': {}}
+
+    try:
+        for mode in ('stages', 'pipeline'):
+
+            WikipediaHandler.pages = {title: dict(page) for title, page in dataset['pages'].items()}
+            WikipediaHandler.revision = [dataset['revision']]
+            WikipediaHandler.changes = []
+
+            with tempfile.TemporaryDirectory() as directory:
+
+                working, config = prepareWorking(dataset, directory)
+
+                environment = dict(os.environ)
+                environment.update({
+                    'WIKI_WORKING_DIR': working,
+                    'WIKI_CONFIG_DIR': config,
+                    'DOIS_CROSSREF_URL': 'http://127.0.0.1:' + str(crossref.server_port),
+                    'DOIS_WIKIPEDIA_URL': 'http://127.0.0.1:' + str(wikipedia.server_port),
+                    'PYTHONPATH': os.path.dirname(DIRECTORY),
+                })
+
+                if mode == 'stages':
+                    commands = {stage: [sys.executable, os.path.join(DIRECTORY, stage)] for stage in STAGES}
+                    commands['dois-compare.py'].append('-p')
+                    commands['dois-retrieve.py'] += shlex.split(settings['retrieve'])
+                else:
+                    commands = {'run': [sys.executable, '-m', 'dois', 'run'] + shlex.split(settings['retrieve'])}
+
+                for name, command in commands.items():
+                    counters.reset()
+                    print('Timing', name, '...')
+                    elapsed, code = runCommand(command, environment)
+                    results[mode][name] = dict(counters.snapshot(), seconds=round(elapsed, 3), exit=code)
+
+    finally:
+        crossref.shutdown()
+        wikipedia.shutdown()
+
+    return results
+
+
+def runCommand(command, environment):
+
+    # Run a stage returning the elapsed time & exit code
+
+    start = time.perf_counter()
+    result = subprocess.run(command, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - start
+
+    if result.returncode != 0:
+        sys.stderr.write('ERROR: ' + ' '.join(command) + ' failed\n' + result.stderr[-2000:] + '\n')
+
+    return elapsed, result.returncode
+
+#
+# Main
+#
+
+def main(arguments):
+
+    settings = dict(DEFAULTS)
+    output = None
+
+    try:
+        arguments, values = getopt.getopt(arguments, 'ho:n:r:', ['seed=', 'latency=', 'limit=', 'interval=', 'concurrency='])
+    except getopt.error as err:
+        print(str(err))
+        sys.exit(2)
+
+    try:
+        for argument, value in arguments:
+            if argument == '-h':
+                print('dois-benchmark.py [-h] [-n PREFIXES] [-o FILE] [-r OPTIONS] [--seed N] [--latency SECONDS]')
+                print('                  [--limit N] [--interval SECONDS] [--concurrency N]')
+                print('  where -n            = number of synthetic prefixes (default ' + str(DEFAULTS['prefixes']) + ', at most ' + str(len(NUMBERS)) + ' valid ones)')
+                print('        -o            = JSON results file (default dois-benchmark-<timestamp>.json)')
+                print("        -r            = extra dois-retrieve.py options for retrieve & run (e.g. '--titles-db --harvest')")
+                print('        --latency     = seconds added to every stand-in response')
+                print('        --limit       = Crossref x-rate-limit-limit header')
+                print('        --interval    = Crossref x-rate-limit-interval header')
+                print('        --concurrency = Crossref x-concurrency-limit header')
+                sys.exit(0)
+            elif argument == '-n':
+                settings['prefixes'] = int(value)
+            elif argument == '-o':
+                output = value
+            elif argument == '-r':
+                settings['retrieve'] = value
+            elif argument == '--latency':
+                settings['latency'] = float(value)
+            else:
+                settings[argument[2:]] = int(value)
+    except ValueError as err:
+        print(str(err))
+        sys.exit(2)
+
+    if not 0 < settings['prefixes'] <= len(NUMBERS):
+        print('-n must be from 1 to ' + str(len(NUMBERS)) + ' (the valid prefix numbers)')
+        sys.exit(2)
+
+    if output is None:
+        output = 'dois-benchmark-' + datetime.now().strftime('%Y%m%d-%H%M%S') + '.json'
+
+    print('Generating', settings['prefixes'], 'prefixes ...')
+    dataset = generateDataset(settings['prefixes'], settings['seed'])
+
+    results = runBenchmark(dataset, settings)
+    results['settings'] = settings
+    results['date'] = datetime.now().isoformat(timespec='seconds')
+
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    for mode in ('stages', 'pipeline'):
+        for name, values in results[mode].items():
+            print(f"{name:20} {values['seconds']:10.3f}s")
+
+    print('Results written to', output)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,15 +1,14 @@
 #!/usr/bin/python3
 
 import calendar
-import csv
 import getopt
-import glob
+import heapq
+import itertools
 import os
 import re
 import sys
-import traceback
 
-from mwclient import Site
+from common import METRICS, describeError, getSite, importSnapshots, latestSnapshots, openStore, retry
 
 #
 # Configuration
@@ -23,152 +22,265 @@ if 'WIKI_CONFIG_DIR' not in os.environ:
     sys.stderr.write('ERROR: WIKI_CONFIG_DIR environment variable not set\n')
     sys.exit(1)
 
+DIRECTORY = os.environ['WIKI_WORKING_DIR'] + '/Dois'
+STORE = DIRECTORY + '/db-registrants.sqlite3'
+METRICSDIR = DIRECTORY + '/metrics'
+PROFILEDIR = DIRECTORY + '/profiles'
 BOTINFO = os.environ['WIKI_CONFIG_DIR'] + '/bot-info.txt'
 PAGE = 'User:JL-Bot/DOI/Deltas'
 
+FIELDS = ('crossref registrant', 'wikipedia registrant', 'crossref target', 'wikipedia target')
+
 #
 # Functions
 #
 
-def extractDate(filename):
+def compare(site, store, currentSnapshot, priorSnapshot, output=False):
+
+    # Compare the Crossref registrants of the current snapshot with the prior
+    # snapshot (as joins in the snapshot store) & save the differences to
+    # Wikipedia (or print them if output)
+
+    print('Comparing', currentSnapshot, 'with', priorSnapshot, '...')
+
+    results = []
+
+    with METRICS.phase('compare'):
+
+        # new or changed
+
+        rows = store.execute('''
+            SELECT current.prefix, previous.prefix, previous.crossrefRegistrant, current.crossrefRegistrant
+            FROM registrants AS current
+            LEFT JOIN registrants AS previous
+                ON previous.snapshot = ? AND previous.prefix = current.prefix
+            WHERE current.snapshot = ?
+                AND (previous.prefix IS NULL OR previous.crossrefRegistrant != current.crossrefRegistrant)
+            ORDER BY current.number
+        ''', (priorSnapshot, currentSnapshot))
+
+        for prefix, found, previous, current in rows:
+            if found is None:
+                if current != 'NONE':
+                    results.append('| [[' + prefix + ']] || NONE || [[' + current + ']]')
+            elif previous == 'NONE':
+                results.append('| [[' + prefix + ']] || NONE || [[' + current + ']]')
+            else:
+                results.append('| [[' + prefix + ']] || [[' + previous + ']] || [[' + current + ']]')
+
+        # removed
+
+        rows = store.execute('''
+            SELECT previous.prefix, previous.crossrefRegistrant
+            FROM registrants AS previous
+            WHERE previous.snapshot = ?
+                AND NOT EXISTS (
+                    SELECT 1 FROM registrants AS current
+                    WHERE current.snapshot = ? AND current.prefix = previous.prefix
+                )
+            ORDER BY previous.number
+        ''', (priorSnapshot, currentSnapshot))
+
+        for prefix, previous in rows:
+            results.append('| [[' + prefix + ']] || [[' + previous + ']] || NONE ([https://api.crossref.org/prefixes/' + prefix + ' validate]) ')
+
+    METRICS.items('compare', len(results))
+
+    # output results
+
+    if output:
+        print('\n\n'.join(results))
+        return
+
+    currentDate = extractDate(currentSnapshot)
+    priorDate = extractDate(priorSnapshot)
+
+    text = 'This page list differences in the CrossRef registrants between the prior and current results:\n'
+    text += '{| class="wikitable sortable"\n|-\n'
+    text += '! DOI !! Prior (' + priorDate + ') || Current (' + currentDate + ')\n|-\n'
+    text += '\n|-\n'.join(results)
+    text += '\n|}'
+
+    with METRICS.phase('deltas'):
+        try:
+            retry(savePage, site, PAGE, text)
+        except Exception as e:
+            sys.stderr.write('ERROR: unable to save ' + PAGE + ': ' + describeError(e) + '\n')
+    METRICS.items('deltas', 1)
+
+    return
 
-    # Extract the date from the file name
 
-    match = re.search(r'^.*doi-registrants-(\d{4})(\d{2})(\d{2})$', filename)
+def extractDate(snapshot):
+
+    # Extract the date from the snapshot name
+
+    match = re.search(r'^(\d{4})(\d{2})(\d{2})$', snapshot)
     if match:
         year = match.group(1)
         month = calendar.month_abbr[int(match.group(2))]
         day = match.group(3)
         date = day + ' ' + month + ' ' + year
     else:
-        sys.exit('ERROR: Could not parse date from ' + filename)
+        sys.exit('ERROR: Could not parse date from ' + snapshot)
 
     return date
 
 
-def getUserInfo(filename):
+def findChanges(store, snapshots):
 
-    # Read in bot userinfo
+    # Compare each snapshot with the one before it (oldest first) yielding
+    # (prefix, field, snapshot, prior value, current value) for every field
+    # that changed. A prefix missing from a snapshot has all fields NONE.
 
-    userinfo = {}
+    missing = ('NONE',) * len(FIELDS)
 
-    try:
-        with open(filename, 'r') as file:
-            for line in file:
-                match = re.search(r'^USERNAME = (.+?)\s*$', line)
-                if match:
-                    userinfo['username'] = match.group(1)
-                match = re.search(r'^PASSWORD = (.+?)\s*$', line)
-                if match:
-                    userinfo['password'] = match.group(1)
+    for prefix, rows in mergeSnapshots(store, snapshots):
+        prior = rows[0] or missing
+        for snapshot, row in zip(snapshots[1:], rows[1:]):
+            row = row or missing
+            for field, old, new in zip(FIELDS, prior, row):
+                if old != new:
+                    yield prefix, field, snapshot, old, new
+            prior = row
 
-        if 'username' not in userinfo:
-            sys.stderr.write('ERROR: username not found\n')
-            sys.exit(1)
 
-        if 'password' not in userinfo:
-            sys.stderr.write('ERROR: password not found\n')
-            sys.exit(1)
+def history(store, snapshots):
 
-    except Exception:
-        traceback.print_exc()
-        sys.exit(1)
+    # Print the changes across the snapshots (oldest first) grouped by field
 
-    return userinfo
+    print('Comparing', ', '.join(snapshots), '...')
 
-#
-# Main
-#
+    changes = {field: [] for field in FIELDS}
 
-output = False
+    with METRICS.phase('history'):
+        for prefix, field, snapshot, old, new in findChanges(store, snapshots):
+            changes[field].append('\t'.join((prefix, snapshot, old, new)))
+    METRICS.items('history', sum(len(values) for values in changes.values()))
 
-try:
-    arguments, values = getopt.getopt(sys.argv[1:], 'hp')
-except getopt.error as err:
-    print(str(err))
-    sys.exit(2)
+    for field in FIELDS:
+        print('\n== ' + field + ' (' + str(len(changes[field])) + ') ==\n')
+        if changes[field]:
+            print('\n'.join(changes[field]))
 
-for argument, value in arguments:
-    if argument == '-h':
-        print('dois-compare.py [-hp]')
-        print('  where -p = print result (instead of saving to Wikipedia)')
-        sys.exit(0)
-    elif argument == '-p':
-        output = True
+    return
 
-# find lastest two files
 
-files = glob.glob(os.environ['WIKI_WORKING_DIR'] + '/Dois/doi-registrants-*')
+def mergeSnapshots(store, snapshots):
 
-currentFile = sorted(files)[-1]
-priorFile = sorted(files)[-2]
+    # Merge-join the snapshots in numeric prefix order yielding the prefix &
+    # the fields from each snapshot (None where the prefix is missing). Each
+    # snapshot is streamed from the store so memory use does not depend on
+    # the number of prefixes.
 
-print('Comparing', os.path.basename(currentFile), 'with', os.path.basename(priorFile), '...')
+    def stream(index, snapshot):
+        rows = store.cursor().execute('''
+            SELECT number, prefix, crossrefRegistrant, wikipediaRegistrant, crossrefTarget, wikipediaTarget
+            FROM registrants
+            WHERE snapshot = ?
+            ORDER BY number
+        ''', (snapshot,))
+        for row in rows:
+            yield row[0], index, row[1], row[2:]
 
-# iterate through files
+    streams = [stream(index, snapshot) for index, snapshot in enumerate(snapshots)]
 
-previous = {}
-current = {}
+    for number, group in itertools.groupby(heapq.merge(*streams), key=lambda item: item[0]):
+        rows = [None] * len(snapshots)
+        for item in group:
+            prefix = item[2]
+            rows[item[1]] = item[3]
+        yield prefix, rows
 
-try:
-    with open(priorFile, 'r') as file:
-        lines = csv.reader(file, delimiter='\t')
-        for line in lines:
-            previous[line[0]] = line[1]
 
-    with open(currentFile, 'r') as file:
-        lines = csv.reader(file, delimiter='\t')
-        for line in lines:
-            current[line[0]] = line[1]
+def savePage(site, title, text):
 
-except Exception:
-    traceback.print_exc()
-    sys.exit(1)
+    # Save the comparison to Wikipedia
 
-# compare the two
+    print('Saving', title, '...')
 
-results = []
+    page = site.pages[title]
+    page.save(text, 'DOI prefix registrant comparison')
 
-for prefix in current:
-    if prefix not in previous:
-        if current[prefix] != 'NONE':
-            results.append('| [[' + prefix + ']] || NONE || [[' + current[prefix] + ']]')
-    elif current[prefix] != previous[prefix]:
-        if previous[prefix] == 'NONE':
-            results.append('| [[' + prefix + ']] || NONE || [[' + current[prefix] + ']]')
-        else:
-            results.append('| [[' + prefix + ']] || [[' + previous[prefix] + ']] || [[' + current[prefix] + ']]')
+    return
+
+#
+# Main
+#
 
-for prefix in previous:
-    if prefix not in current:
-        results.append('| [[' + prefix + ']] || [[' + previous[prefix] + ']] || NONE ([https://api.crossref.org/prefixes/' + prefix + ' validate]) ')
+def main(arguments):
 
-# output results
+    output = False
+    count = None
+    since = None
 
-if output:
-    print('\n\n'.join(results))
-else:
+    try:
+        arguments, values = getopt.getopt(arguments, 'hpn:s:', ['profile'])
+    except getopt.error as err:
+        print(str(err))
+        sys.exit(2)
+
+    for argument, value in arguments:
+        if argument == '-h':
+            print('dois-compare.py [-hp] [-n COUNT] [-s YYYYMMDD] [--profile]')
+            print('  where -p        = print result (instead of saving to Wikipedia)')
+            print('        -n        = print changes to all fields across the latest COUNT snapshots')
+            print('        -s        = print changes to all fields since YYYYMMDD')
+            print('        --profile = write CPU & memory profiles of each phase to Dois/profiles')
+            sys.exit(0)
+        elif argument == '-p':
+            output = True
+        elif argument == '-n':
+            if not value.isdigit() or int(value) < 2:
+                print('count must be at least 2')
+                sys.exit(2)
+            count = int(value)
+        elif argument == '-s':
+            if not re.search(r'^\d{8}$', value):
+                print('date must be YYYYMMDD')
+                sys.exit(2)
+            since = value
+        elif argument == '--profile':
+            METRICS.profile(PROFILEDIR)
+
+    METRICS.start(METRICSDIR, 'compare')
+
+    store = openStore(STORE)
+    importSnapshots(store, DIRECTORY)
+
+    # history across several snapshots
+
+    if count or since:
+        if count:
+            snapshots = latestSnapshots(store, count)
+        else:
+            # snapshots since the date plus the one before as the baseline
+            snapshots = latestSnapshots(store, 1, since)
+            snapshots += [row[0] for row in store.execute(
+                'SELECT snapshot FROM snapshots WHERE snapshot >= ? ORDER BY snapshot DESC', (since,)
+            )]
+        history(store, sorted(snapshots))
+        store.close()
+        METRICS.write(METRICSDIR, 'compare')
+        METRICS.dump('compare')
+        return
+
+    # find lastest two snapshots
+
+    current, prior = latestSnapshots(store, 2)
+
+    if output:
+        site = None
+    else:
+        site = getSite(BOTINFO)
 
-    # initiate bot
+    compare(site, store, current, prior, output)
 
-    userinfo = getUserInfo(BOTINFO)
+    store.close()
 
-    try:
-        site = Site('en.wikipedia.org', clients_useragent='JL-Bot/0.0 (https://en.wikipedia.org/wiki/User_talk:JL-Bot)')
-        site.login(userinfo['username'], userinfo['password'])
-    except Exception:
-        traceback.print_exc()
-        sys.exit(1)
-
-    currentDate = extractDate(currentFile)
-    priorDate = extractDate(priorFile)
-
-    output = 'This page list differences in the CrossRef registrants between the prior and current results:\n'
-    output += '{| class="wikitable sortable"\n|-\n'
-    output += '! DOI !! Prior (' + priorDate + ') || Current (' + currentDate + ')\n|-\n'
-    output += '\n|-\n'.join(results)
-    output += '\n|}'
-
-    print('Saving', PAGE, '...')
-    page = site.pages[PAGE]
-    page.save(output, 'DOI prefix registrant comparison')
\ No newline at end of file
+    METRICS.write(METRICSDIR, 'compare')
+    METRICS.dump('compare')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
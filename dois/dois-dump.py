@@ -0,0 +1,304 @@
+#!/usr/bin/python3
+
+# This extracts the registrant & target of the DOI prefix redirects (10.xxxx)
+# from the Wikipedia database dump so retrieve need only check they have not
+# been edited since. With the multistream dump & its index only the streams
+# holding prefix titles are read, decompressed in parallel across processes.
+# The results are cached per dump date in Dois/doi-dump-YYYYMMDD (prefix,
+# revision id, registrant, target).
+
+import bz2
+import getopt
+import glob
+import html
+import multiprocessing
+import os
+import re
+import sys
+import traceback
+
+from concurrent.futures import ProcessPoolExecutor
+
+from common import METRICS, parsePage
+
+#
+# Configuration
+#
+
+if 'WIKI_WORKING_DIR' not in os.environ:
+    sys.stderr.write('ERROR: WIKI_WORKING_DIR environment variable not set\n')
+    sys.exit(1)
+
+DUMPS = os.environ['WIKI_WORKING_DIR']                  # where wiki-bot-citations downloads the dump
+STORAGE = os.environ['WIKI_WORKING_DIR'] + '/Dois/doi-dump-'
+METRICSDIR = os.environ['WIKI_WORKING_DIR'] + '/Dois/metrics'
+PROFILEDIR = os.environ['WIKI_WORKING_DIR'] + '/Dois/profiles'
+WORKERS = os.cpu_count() or 1   # processes decompressing streams
+TASKSIZE = 16                   # streams per task handed to a process
+READSIZE = 1024 * 1024          # bytes read at a time from a single stream dump
+
+PREFIX = re.compile(r'^10\.\d+$')
+PAGE = re.compile(r'<page>(.*?)</page>', re.DOTALL)
+TITLE = re.compile(r'<title>(.*?)</title>')
+NAMESPACE = re.compile(r'<ns>(\d+)</ns>')
+REVISION = re.compile(r'<revision>\s*<id>(\d+)</id>')
+TEXT = re.compile(r'<text[^>]*?(?:/>|>(.*?)</text>)', re.DOTALL)
+
+#
+# Functions
+#
+
+def extractDump(dump, filename, workers):
+
+    # Extract the DOI prefix pages from the dump & write them to the file
+
+    with METRICS.phase('extract'):
+        pages = readDump(dump, workers)
+    METRICS.items('extract', len(pages))
+    writePrefixes(filename, pages)
+
+    print('Extracted ' + str(len(pages)) + ' DOI prefix pages to ' + os.path.basename(filename))
+
+    return
+
+
+def extractPages(text):
+
+    # Extract (title, revision id, registrant, target) for each DOI prefix
+    # page in the article namespace from the <page> elements in the text
+
+    results = []
+
+    for match in PAGE.finditer(text):
+
+        page = match.group(1)
+
+        title = TITLE.search(page)
+        if not title:
+            continue
+        title = html.unescape(title.group(1))
+        if not PREFIX.search(title):
+            continue
+
+        namespace = NAMESPACE.search(page)
+        if namespace and namespace.group(1) != '0':
+            continue
+
+        revision = REVISION.search(page)
+        revision = revision.group(1) if revision else '0'
+
+        content = TEXT.search(page)
+        content = html.unescape(content.group(1) or '') if content else ''
+
+        registrant, target = parsePage(title, content)
+        results.append((title, revision, registrant, target))
+
+    return results
+
+
+def extractStreams(filename, ranges):
+
+    # Decompress the streams (start, end byte offsets) of a multistream dump
+    # & extract the DOI prefix pages from them (run in a worker process)
+
+    results = []
+
+    with open(filename, 'rb') as file:
+        for start, end in ranges:
+            file.seek(start)
+            text = bz2.decompress(file.read(end - start)).decode('utf-8')
+            results.extend(extractPages(text))
+
+    return results
+
+
+def findDump(directory):
+
+    # Find the latest dump in the directory (the multistream one if both are
+    # present for that date) returning the file name & date or None
+
+    dumps = {}
+    for filename in glob.glob(os.path.join(directory, 'enwiki-*-pages-articles*.xml.bz2')):
+        match = re.search(r'enwiki-(\d{8})-pages-articles(-multistream)?\.xml\.bz2$', filename)
+        if match and (match.group(1) not in dumps or match.group(2)):
+            dumps[match.group(1)] = filename
+
+    if not dumps:
+        return None
+
+    stamp = max(dumps)
+
+    return dumps[stamp], stamp
+
+
+def findStreams(index, size):
+
+    # Read the multistream index (offset:page id:title per line) returning
+    # the (start, end) byte range of each stream holding a DOI prefix title
+
+    offsets = set()
+    selected = set()
+
+    with bz2.open(index, 'rt', encoding='utf-8') as file:
+        for line in file:
+            offset, pageId, title = line.rstrip('\n').split(':', 2)
+            offset = int(offset)
+            offsets.add(offset)
+            if PREFIX.search(title):
+                selected.add(offset)
+
+    # a stream ends where the next one starts (the last at the end of the file)
+
+    offsets = sorted(offsets)
+    ends = dict(zip(offsets, offsets[1:] + [size]))
+
+    return [(offset, ends[offset]) for offset in sorted(selected)]
+
+
+def indexFor(filename):
+
+    # Return the multistream index for a dump (None if there is none)
+
+    if not filename.endswith('-multistream.xml.bz2'):
+        return None
+
+    index = filename[:-len('.xml.bz2')] + '-index.txt.bz2'
+    if not os.path.exists(index):
+        return None
+
+    return index
+
+
+def readDump(filename, workers):
+
+    # Extract the DOI prefix pages from the dump returning (title, revision
+    # id, registrant, target) for each. Streams are decompressed in parallel when there is a
+    # multistream index, otherwise the dump is streamed in a single pass.
+
+    index = indexFor(filename)
+
+    if index is None:
+        print('No multistream index, reading ' + os.path.basename(filename) + ' sequentially ...')
+        return readSequential(filename)
+
+    with METRICS.phase('index'):
+        streams = findStreams(index, os.path.getsize(filename))
+    METRICS.items('index', len(streams))
+
+    print('Reading ' + str(len(streams)) + ' streams with ' + str(workers) + ' processes ...')
+
+    tasks = [streams[i:i + TASKSIZE] for i in range(0, len(streams), TASKSIZE)]
+    results = []
+
+    # workers are forked as this may be loaded as a module by python3 -m dois
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as executor:
+        for pages in executor.map(extractStreams, [filename] * len(tasks), tasks):
+            results.extend(pages)
+
+    return results
+
+
+def readSequential(filename):
+
+    # Stream a (single stream) dump extracting the DOI prefix pages, holding
+    # no more than the page being read
+
+    results = []
+    buffer = ''
+
+    with bz2.open(filename, 'rt', encoding='utf-8') as file:
+        while True:
+            chunk = file.read(READSIZE)
+            if not chunk:
+                break
+            buffer += chunk
+            end = buffer.rfind('</page>')
+            if end < 0:
+                continue
+            end += len('</page>')
+            results.extend(extractPages(buffer[:end]))
+            buffer = buffer[end:]
+
+    return results
+
+
+def writePrefixes(filename, pages):
+
+    # Write the prefix, revision id, registrant & target of each page (sorted
+    # by prefix)
+
+    with open(filename + '.tmp', 'w') as file:
+        for page in sorted(pages, key=lambda page: int(page[0][3:])):
+            file.write('\t'.join(page) + '\n')
+    os.replace(filename + '.tmp', filename)
+
+    return
+
+#
+# Main
+#
+
+def main(arguments):
+
+    dump = None
+    refresh = False
+    workers = WORKERS
+
+    try:
+        arguments, values = getopt.getopt(arguments, 'hd:w:', ['refresh', 'profile'])
+    except getopt.error as err:
+        print(str(err))
+        sys.exit(2)
+
+    for argument, value in arguments:
+        if argument == '-h':
+            print('dois-dump.py [-h] [-d DUMP] [-w WORKERS] [--refresh] [--profile]')
+            print('  extracts the DOI prefix redirects from the database dump to Dois/doi-dump-YYYYMMDD')
+            print('  where -d        = dump file (default the latest enwiki-*-pages-articles dump)')
+            print('        -w        = processes decompressing streams (default ' + str(WORKERS) + ')')
+            print('        --refresh = extract again even if already done for the dump')
+            print('        --profile = write CPU & memory profiles of each phase to Dois/profiles')
+            sys.exit(0)
+        elif argument == '-d':
+            dump = value
+        elif argument == '-w':
+            workers = int(value)
+        elif argument == '--refresh':
+            refresh = True
+        elif argument == '--profile':
+            METRICS.profile(PROFILEDIR)
+
+    if dump:
+        match = re.search(r'enwiki-(\d{8})-pages-articles', dump)
+        if not match:
+            sys.stderr.write('ERROR: could not parse dump date (' + dump + ')\n')
+            sys.exit(1)
+        stamp = match.group(1)
+    else:
+        found = findDump(DUMPS)
+        if not found:
+            sys.stderr.write('ERROR: no enwiki-*-pages-articles dump in ' + DUMPS + '\n')
+            sys.exit(1)
+        dump, stamp = found
+
+    filename = STORAGE + stamp
+
+    if os.path.exists(filename) and not refresh:
+        print('Already extracted ' + os.path.basename(filename))
+        return
+
+    METRICS.start(METRICSDIR, 'dump')
+
+    try:
+        extractDump(dump, filename, workers)
+    except Exception:
+        traceback.print_exc()
+        sys.exit(1)
+
+    METRICS.write(METRICSDIR, 'dump')
+    METRICS.dump('dump')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -2,13 +2,15 @@
 
 # This 'recreates' the prior version from the Wikipedia pages incase file lost
 
-import csv
+import getopt
 import os
 import re
 import sys
 import traceback
 
-from mwclient import Site
+from concurrent.futures import ThreadPoolExecutor
+
+from common import METRICS, DeferredQueue, getSite, queryPages, querySize, revisionText
 
 #
 # Configuration
@@ -23,7 +25,22 @@ if 'WIKI_CONFIG_DIR' not in os.environ:
     sys.exit(1)
 
 STORAGE = os.environ['WIKI_WORKING_DIR'] + '/Dois/doi-registrants-prior'
+REVISIONS = os.environ['WIKI_WORKING_DIR'] + '/Dois/doi-prior-revisions'     # outside the doi-registrants-* snapshots
 BOTINFO = os.environ['WIKI_CONFIG_DIR'] + '/bot-info.txt'
+SUMMARY = 'User:JL-Bot/DOI'
+WORKERS = 4                 # parallel single title queries (needed for --as-of)
+METRICSDIR = os.environ['WIKI_WORKING_DIR'] + '/Dois/metrics'
+PROFILEDIR = os.environ['WIKI_WORKING_DIR'] + '/Dois/profiles'
+
+# a row in either of the two formats written by dois-upload.py
+
+RECORD = re.compile(
+    r'^{{JCW-DOI-prefix\|(?:'
+    r'(.+?)\|(.+?)\|(.+?)\|4=Crossref = \[\[(.+?)\]\]<br/>Wikipedia = \[\[(.+?)\]\]'
+    r'|(.+?)\|(.+?)\|(.+?)\|(.+?)}})',
+    re.MULTILINE
+)
+SUBPAGE = re.compile(r'^\* \[\[User:JL-Bot/DOI/\d+.\d+\|(\d+.\d+)\]\]$', re.MULTILINE)
 
 #
 # Functions
@@ -31,158 +48,234 @@ BOTINFO = os.environ['WIKI_CONFIG_DIR'] + '/bot-info.txt'
 
 def extractRecords(contents):
 
-    # extract the doi information from the page contents
+    # extract the doi information from the page contents (one pass over the
+    # page) yielding each record
     # prefix, crossref registrant, wikipedia registrant, crossref target, wikipedia target
 
-    records = []
+    for match in RECORD.finditer(contents):
 
-    for line in contents.splitlines():
+        if match.group(1):
+            prefix, crossrefRegistrant, wikipediaRegistrant, crossrefTarget, wikipediaTarget = match.group(1, 2, 3, 4, 5)
+        else:
+            prefix, crossrefRegistrant, wikipediaRegistrant, wikipediaTarget = match.group(6, 7, 8, 9)
+            crossrefTarget = 'NONE'
 
-        prefix = ''
-        crossrefRegistrant = ''
-        wikipediaRegistrant = ''
-        crossrefTarget = ''
-        wikipediaTarget = ''
+        if crossrefRegistrant == '-':
+            crossrefRegistrant = 'NONE'
 
-        # two possible patterns
+        if wikipediaRegistrant == '-':
+            wikipediaRegistrant = 'NONE'
 
-        match = re.search(r'^{{JCW-DOI-prefix\|(.+?)\|(.+?)\|(.+?)\|4=Crossref = \[\[(.+?)\]\]<br/>Wikipedia = \[\[(.+?)\]\]', line)
-        if match:
-            prefix = match.group(1)
-            crossrefRegistrant = match.group(2)
-            wikipediaRegistrant = match.group(3)
-            crossrefTarget = match.group(4)
-            wikipediaTarget = match.group(5)
-        else:
-            match = re.search(r'^{{JCW-DOI-prefix\|(.+?)\|(.+?)\|(.+?)\|(.+?)}}', line)
-            if match:
-                prefix = match.group(1)
-                crossrefRegistrant = match.group(2)
-                wikipediaRegistrant = match.group(3)
-                crossrefTarget = 'NONE'
-                wikipediaTarget = match.group(4)
+        if crossrefTarget == '-':
+            crossrefTarget = 'NONE'
 
-        # if either pattern found
+        if wikipediaTarget == '-':
+            wikipediaTarget = 'NONE'
 
-        if (prefix):
+        if crossrefTarget.startswith(':'):
+            crossrefTarget = crossrefTarget[1:]
 
-            if crossrefRegistrant == '-':
-                crossrefRegistrant = 'NONE'
+        if wikipediaTarget.startswith(':'):
+            wikipediaTarget = wikipediaTarget[1:]
 
-            if wikipediaRegistrant == '-':
-                wikipediaRegistrant = 'NONE'
+        yield (prefix, crossrefRegistrant, wikipediaRegistrant, crossrefTarget, wikipediaTarget)
 
-            if crossrefTarget == '-':
-                crossrefTarget = 'NONE'
 
-            if wikipediaTarget == '-':
-                wikipediaTarget = 'NONE'
+def getPages(site, asOf=None):
 
-            if crossrefTarget.startswith(':'):
-                crossrefTarget = crossrefTarget[1:]
+    # find pages from summary page (as it was at asOf if given) returning
+    # them & the revision id & timestamp of the summary page used
 
-            if wikipediaTarget.startswith(':'):
-                wikipediaTarget = wikipediaTarget[1:]
+    revisions = retrievePages(site, [SUMMARY], asOf)
 
-            records.append((prefix, crossrefRegistrant, wikipediaRegistrant, crossrefTarget, wikipediaTarget))
+    if SUMMARY not in revisions:
+        sys.stderr.write('ERROR: ' + SUMMARY + ' not found\n')
+        sys.exit(1)
 
-    return records
+    text, revid, timestamp = revisions[SUMMARY]
 
+    return SUBPAGE.findall(text), (revid, timestamp)
 
-def getPages(site):
 
-    # find pages from summary page
+def queryRevisions(site, titles, parameters):
 
-    title = 'User:JL-Bot/DOI'
-    page = site.pages[title]
+    # Retrieve the text, revision id & timestamp of the titles in one query
+    # (titles without a matching revision are left out)
 
-    pages = []
+    parameters = dict(parameters, prop='revisions', rvprop='ids|timestamp|content', rvslots='main')
+    results = {}
 
-    for line in page.text().splitlines():
-        match = re.search(r'^\* \[\[User:JL-Bot/DOI/\d+.\d+\|(\d+.\d+)\]\]$', line)
-        if match:
-            pages.append(match.group(1))
+    for title, item in queryPages(site, titles, parameters).items():
+        if 'revisions' in item:
+            revision = item['revisions'][0]
+            results[title] = (revisionText(revision), revision['revid'], revision['timestamp'])
 
-    return pages
+    return results
 
 
-def getUserInfo(filename):
+def recover(site, asOf=None):
 
-    # read in bot userinfo
+    # find pages and retrieve them in batches, streaming the records to the
+    # output file in page order. Batches that keep failing are retried at
+    # the end (later batches are held until they can be written in order).
 
-    userinfo = {}
+    with METRICS.phase('pages'):
+        pages, summary = getPages(site, asOf)
+    METRICS.items('pages', len(pages))
+
+    size = querySize(site)
+    batches = [pages[i:i + size] for i in range(0, len(pages), size)]
+    deferred = DeferredQueue('batch')
+    revisions = {SUMMARY: summary}
+    done = {}
+    position = 0
 
     try:
-        with open(filename, 'r') as file:
-            for line in file:
-                match = re.search(r'^USERNAME = (.+?)\s*$', line)
-                if match:
-                    userinfo['username'] = match.group(1)
-                match = re.search(r'^PASSWORD = (.+?)\s*$', line)
-                if match:
-                    userinfo['password'] = match.group(1)
-
-        if 'username' not in userinfo:
-            sys.stderr.write('ERROR: username not found\n')
-            sys.exit(1)
-
-        if 'password' not in userinfo:
-            sys.stderr.write('ERROR: password not found\n')
-            sys.exit(1)
+        file = open(STORAGE, 'w')
+
+        for index, batch in enumerate(batches):
+            print('Retrieving', batch[0], 'to', batch[-1], '...')
+            with METRICS.phase('retrieve'):
+                try:
+                    done[index] = retrievePages(site, ['User:JL-Bot/DOI/' + page for page in batch], asOf)
+                except Exception as e:
+                    deferred.add(index, e, retrievePages, site, ['User:JL-Bot/DOI/' + page for page in batch], asOf)
+            METRICS.items('retrieve', len(batch))
+            position = writeBatches(file, batches, done, position, revisions)
+
+        retried, failed = deferred.run()
+        done.update(retried)
+        position = writeBatches(file, batches, done, position, revisions)
+
+        file.close()
 
     except Exception:
         traceback.print_exc()
         sys.exit(1)
 
-    return userinfo
+    writeRevisions(REVISIONS, revisions)
+
+    missing = [page for page in pages if 'User:JL-Bot/DOI/' + page not in revisions]
+    if missing:
+        sys.stderr.write('ERROR: ' + STORAGE + ' is missing ' + ', '.join(missing) + '\n')
+        sys.exit(1)
+
+    return
+
+
+def retrievePages(site, titles, asOf=None):
+
+    # Retrieve the text, revision id & timestamp of the titles: the latest
+    # revisions in one query or, as a revision start only works for a single
+    # title, the last revisions at or before asOf in parallel queries
+
+    if asOf is None:
+        return queryRevisions(site, titles, {})
+
+    parameters = {'rvlimit': 1, 'rvstart': asOf, 'rvdir': 'older'}
+    results = {}
+
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        for revisions in executor.map(lambda title: queryRevisions(site, [title], parameters), titles):
+            results.update(revisions)
+
+    return results
 
 
-def retrievePage(doi):
+def writeBatches(file, batches, done, position, revisions):
 
-    # retrieve contents of Wikipedia page
+    # Write the records of the retrieved batches from position onwards
+    # (stopping at the first one not retrieved) returning the new position
 
-    title = 'User:JL-Bot/DOI/' + doi
-    page = site.pages[title]
+    while position in done:
 
-    return page.text()
+        pages = done.pop(position)
+
+        for page in batches[position]:
+            title = 'User:JL-Bot/DOI/' + page
+            if title in pages:
+                text, revid, timestamp = pages[title]
+                revisions[title] = (revid, timestamp)
+                with METRICS.phase('extract'):
+                    count = writeRecords(file, extractRecords(text))
+                METRICS.items('extract', count)
+
+        position += 1
+
+    return position
 
 
 def writeRecords(file, records):
 
-    # write the records to output file
+    # write the records to output file returning the number written
+
+    count = 0
 
     for record in records:
         file.write('\t'.join(record) + '\n')
+        count += 1
 
-    return
+    return count
 
-#
-# Main
-#
 
-# initiate bot
+def writeRevisions(filename, revisions):
 
-userinfo = getUserInfo(BOTINFO)
+    # write the revision id & timestamp of each page used so the recovery
+    # can be repeated with --as-of
 
-try:
-    site = Site('en.wikipedia.org', clients_useragent='JL-Bot/0.0 (https://en.wikipedia.org/wiki/User_talk:JL-Bot)')
-    site.login(userinfo['username'], userinfo['password'])
-except Exception:
-    traceback.print_exc()
-    sys.exit(1)
+    try:
+        with open(filename, 'w') as file:
+            for title, revision in revisions.items():
+                file.write('\t'.join((title, str(revision[0]), revision[1])) + '\n')
 
-# find pages and iterate through them
+    except Exception:
+        traceback.print_exc()
+        sys.exit(1)
+
+    return
+
+#
+# Main
+#
 
-pages = getPages(site)
+def main(arguments):
 
-try:
-    file = open(STORAGE, 'w')
-    for page in pages:
-        print('Precessing', page, '...')
-        contents = retrievePage(page)
-        records = extractRecords(contents)
-        writeRecords(file, records)
+    asOf = None
 
-except Exception:
-    traceback.print_exc()
-    sys.exit(1)
+    try:
+        arguments, values = getopt.getopt(arguments, 'h', ['profile', 'as-of='])
+    except getopt.error as err:
+        print(str(err))
+        sys.exit(2)
+
+    for argument, value in arguments:
+        if argument == '-h':
+            print('dois-prior.py [-h] [--as-of TIMESTAMP] [--profile]')
+            print('  recreates doi-registrants-prior from the Wikipedia pages')
+            print('  where --as-of   = use the pages as they were at TIMESTAMP (YYYYMMDD or YYYY-MM-DDTHH:MM:SSZ)')
+            print('        --profile = write CPU & memory profiles of each phase to Dois/profiles')
+            sys.exit(0)
+        elif argument == '--profile':
+            METRICS.profile(PROFILEDIR)
+        elif argument == '--as-of':
+            if re.search(r'^\d{8}$', value):
+                # end of the day
+                asOf = value + '235959'
+            elif re.search(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z$', value):
+                asOf = value
+            else:
+                print('timestamp must be YYYYMMDD or YYYY-MM-DDTHH:MM:SSZ')
+                sys.exit(2)
+
+    METRICS.start(METRICSDIR, 'prior')
+
+    site = getSite(BOTINFO)
+
+    recover(site, asOf)
+
+    METRICS.write(METRICSDIR, 'prior')
+    METRICS.dump('prior')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
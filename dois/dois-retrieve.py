@@ -1,17 +1,25 @@
 #!/usr/bin/python3
 
 from enum import unique
+import getopt
+import json
 import os
+import queue
 import re
 import requests
+import sqlite3
 import sys
+import threading
 import time
 import traceback
 
 from collections import defaultdict
-from datetime import date
-from mwclient import Site
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
 from tqdm import tqdm
+from urllib.parse import quote
+
+from common import METRICS, DeferredQueue, TransientError, describeError, getSite, normalizeTarget, openSession, openStore, parsePage, queryPages, querySize, readSnapshot, retry, revisionText, saveSnapshot
 
 
 #
@@ -26,51 +34,552 @@ if 'WIKI_CONFIG_DIR' not in os.environ:
     sys.stderr.write('ERROR: WIKI_CONFIG_DIR environment variable not set\n')
     sys.exit(1)
 
-APIMEMBERS = 'https://api.crossref.org/members/'
-APIPREFIXES = 'https://api.crossref.org/prefixes/'
+CROSSREF = os.environ.get('DOIS_CROSSREF_URL', 'https://api.crossref.org')     # override for testing
+APIMEMBERS = CROSSREF + '/members/'
+APIPREFIXES = CROSSREF + '/prefixes/'
 BLOCKSIZE = 500             # API supports 1000, but fails to return all results at that size
+WORKERS = 10                # maximum parallel Crossref requests (also limited by headers)
+TIMEOUT = (10, 60)          # seconds to connect to & between bytes from Crossref before retrying
+
+CACHETTL = 30               # days before a cached Crossref response is revalidated
+CACHESIZE = 512             # megabytes before least recently used responses are evicted
+
+HARVESTTEMPLATE = 'Template:R from DOI prefix'     # transcluded by the DOI prefix redirects with their registrant
+PIPELINEDEPTH = 8           # batches of titles found by Crossref waiting to be looked up
+RCMAXAGE = 30               # days of recent changes kept (dumps older than this are not used)
+CHANGES = [                 # recent changes that can alter a title's existence or redirect target
+    {'rctype': 'new', 'rcnamespace': 0},
+    {'rctype': 'log'},
+    {'rctype': 'edit', 'rcnamespace': 0, 'rctag': 'mw-new-redirect'},
+    {'rctype': 'edit', 'rcnamespace': 0, 'rctag': 'mw-removed-redirect'},
+    {'rctype': 'edit', 'rcnamespace': 0, 'rctag': 'mw-changed-redirect-target'},
+]
+
+STORAGE = os.environ['WIKI_WORKING_DIR'] + '/Dois/doi-registrants-'
+CHECKPOINT = os.environ['WIKI_WORKING_DIR'] + '/Dois/doi-checkpoint-'
+CACHE = os.environ['WIKI_WORKING_DIR'] + '/Dois/crossref-cache.sqlite3'
+REVISIONS = os.environ['WIKI_WORKING_DIR'] + '/Dois/doi-revisions'
+STORE = os.environ['WIKI_WORKING_DIR'] + '/Dois/db-registrants.sqlite3'
+METRICSDIR = os.environ['WIKI_WORKING_DIR'] + '/Dois/metrics'
+PROFILEDIR = os.environ['WIKI_WORKING_DIR'] + '/Dois/profiles'
+TITLESDB = os.environ['WIKI_WORKING_DIR'] + '/Citations/db-titles.sqlite3'
+DUMPPREFIXES = os.environ['WIKI_WORKING_DIR'] + '/Dois/doi-dump-'
 
 BOTINFO = os.environ['WIKI_CONFIG_DIR'] + '/bot-info.txt'
 EMAILINFO = os.environ['WIKI_CONFIG_DIR'] + '/email-info.txt'
 
+#
+# Classes
+#
+
+class RateLimiter:
+
+    # Token bucket shared by all Crossref requests. The bucket refills at
+    # limit requests per interval seconds and in flight requests are capped
+    # by the concurrency limit. All three are updated from the response
+    # headers so changes mid-run are picked up.
+
+    def __init__(self, limit=1, interval=1, concurrency=1):
+        self.condition = threading.Condition()
+        self.limit = limit
+        self.interval = interval
+        self.concurrency = concurrency
+        self.tokens = limit
+        self.active = 0
+        self.updated = time.monotonic()
+        self.warning = 0
+
+    def acquire(self):
+
+        # Wait for a free slot & token (time spent waiting is recorded)
+
+        entered = time.monotonic()
+
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                rate = self.limit / self.interval
+                self.tokens = min(self.limit, self.tokens + (now - self.updated) * rate)
+                self.updated = now
+                slots = min(self.concurrency, WORKERS)
+                if self.active < slots and self.tokens >= 1:
+                    self.tokens -= 1
+                    self.active += 1
+                    if now > entered:
+                        METRICS.count('ratelimit_wait_seconds', now - entered)
+                    return
+                if self.active >= slots:
+                    self.condition.wait()
+                else:
+                    self.condition.wait((1 - self.tokens) / rate)
+
+    def release(self, headers=None):
+
+        # Free the slot & adapt to the returned headers
+
+        with self.condition:
+            self.active -= 1
+            if headers is not None:
+                self.limit, self.interval, self.concurrency, self.warning = checkRateLimit(
+                    headers, self.limit, self.interval, self.concurrency, self.warning
+                )
+                self.tokens = min(self.tokens, self.limit)
+            self.condition.notify_all()
+
+class ResponseCache:
+
+    # Crossref responses stored in SQLite across runs. Entries younger than the
+    # ttl are used without a request, older ones are revalidated with a
+    # conditional request (if the response had an ETag or Last-Modified), and
+    # the least recently used are evicted once the cache exceeds its size.
+    # Refresh ignores what is cached but still stores the new responses.
+
+    def __init__(self, filename, ttl, size, refresh=False):
+        self.lock = threading.Lock()
+        self.ttl = ttl * 86400
+        self.size = size * 1024 * 1024
+        self.refresh = refresh
+        self.pending = 0
+        self.hits = 0
+        self.misses = 0
+        try:
+            self.connection = sqlite3.connect(filename, check_same_thread=False)
+            self.connection.execute('PRAGMA journal_mode = WAL')
+            self.connection.execute('''
+                CREATE TABLE IF NOT EXISTS responses (
+                    url      TEXT PRIMARY KEY,
+                    status   INTEGER,
+                    body     TEXT,
+                    etag     TEXT,
+                    modified TEXT,
+                    stored   REAL,
+                    accessed REAL,
+                    size     INTEGER
+                )
+            ''')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS accessed ON responses (accessed)')
+        except sqlite3.Error:
+            traceback.print_exc()
+            sys.exit(1)
+
+    def close(self):
+
+        # Evict least recently used responses if over size & close
+
+        with self.lock:
+            total = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+            if total > self.size:
+                evict = []
+                for url, size in self.connection.execute('SELECT url, size FROM responses ORDER BY accessed'):
+                    if total <= self.size:
+                        break
+                    evict.append((url,))
+                    total -= size
+                self.connection.executemany('DELETE FROM responses WHERE url = ?', evict)
+            self.connection.commit()
+            self.connection.close()
+
+        if self.hits or self.misses:
+            print(f'Crossref cache: {self.hits} hits, {self.misses} misses')
+
+    def get(self, url):
+
+        # Return the cached response (or None) & whether it is still fresh
+
+        if self.refresh:
+            return None, False
+
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT status, body, etag, modified, stored FROM responses WHERE url = ?', (url,)
+            ).fetchone()
+
+        if row is None:
+            self.misses += 1
+            METRICS.count('cache_misses')
+            return None, False
+
+        cached = {'status': row[0], 'text': row[1], 'etag': row[2], 'modified': row[3]}
+        fresh = time.time() - row[4] < self.ttl
+
+        if fresh:
+            self.hits += 1
+            METRICS.count('cache_hits')
+            self.touch(url, False)
+        else:
+            self.misses += 1
+            METRICS.count('cache_misses')
+
+        return cached, fresh
+
+    def put(self, url, status, text, etag, modified):
+
+        # Store a response
+
+        now = time.time()
+
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (url, status, text, etag, modified, now, now, len(text))
+            )
+            self.commit()
+
+    def touch(self, url, revalidated=True):
+
+        # Mark a response as used (& as stored now if it was revalidated)
+
+        now = time.time()
+
+        with self.lock:
+            if revalidated:
+                self.connection.execute('UPDATE responses SET stored = ?, accessed = ? WHERE url = ?', (now, now, url))
+            else:
+                self.connection.execute('UPDATE responses SET accessed = ? WHERE url = ?', (now, url))
+            self.commit()
+
+    def commit(self):
+
+        # Commit periodically (called with the lock held)
+
+        self.pending += 1
+        if self.pending >= 100:
+            self.connection.commit()
+            self.pending = 0
+
+
+class TitleDatabase:
+
+    # Existence & redirect targets of article titles from the title database
+    # the Citations task builds from the dump, with the revision, registrant &
+    # target of DOI prefix pages from dois-dump.py for the same dump. Titles
+    # changed since the dump (or outside the article namespace) are left to
+    # the live queries as are existing prefix pages, whose registrant can be
+    # edited without a change being listed (their dump revision is checked).
+
+    def __init__(self, filename, changed, namespaces, prefixes):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.changed = changed
+        self.namespaces = namespaces
+        self.prefixes = prefixes
+        self.answered = 0
+        self.live = 0
+
+    def close(self):
+
+        # Close the database
+
+        self.connection.close()
+
+    def lookup(self, titles):
+
+        # Return existence & target of the titles the database can answer
+        # keyed by the requested titles
+
+        keys = {}
+        for title in titles:
+            key = normalizeTitle(title)
+            if key in self.changed:
+                continue
+            if ':' in key and key.split(':', 1)[0].strip().lower() in self.namespaces:
+                continue
+            keys[key] = title
+
+        found = {}
+        names = list(keys)
+        with self.lock:
+            for i in range(0, len(names), 500):
+                batch = names[i:i + 500]
+                rows = self.connection.execute(
+                    'SELECT title, pageType, target FROM titles WHERE title IN (' + ','.join('?' * len(batch)) + ')', batch
+                ).fetchall()
+                for title, pageType, target in rows:
+                    found[title] = (pageType, target)
+
+        # titles MediaWiki may normalize further than normalizeTitle (entities,
+        # Unicode forms, namespace aliases, ...) are only missing if the live
+        # query says so
+
+        results = {}
+        for key, title in keys.items():
+            if key not in found:
+                if key == title and not re.search(r'[&:]|[^\x00-\x7f]', title):
+                    results[title] = {'exists': False, 'revid': 0, 'text': ''}
+            elif re.search(r'^10\.\d+$', key):
+                continue
+            elif found[key][0].startswith('REDIRECT'):
+                results[title] = {'exists': True, 'revid': 0, 'registrant': 'NONE', 'target': found[key][1]}
+            else:
+                results[title] = {'exists': True, 'revid': 0, 'registrant': 'NONE', 'target': 'NONE'}
+
+        return results
+
+
+class TitleMemo:
+
+    # Title lookups for the run keyed by the normalized title, so each
+    # distinct registrant is looked up once however many prefixes share it
+    # (& titles prefetched while Crossref is queried are not looked up again)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pages = {}
+        self.seen = set()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, title):
+        return normalizeTitle(title) in self.pages
+
+    def __getitem__(self, title):
+        return self.pages[normalizeTitle(title)]
+
+    def lookup(self, titles):
+
+        # Return the titles (one per normalized title) that are not in the
+        # memo (so those whose lookup failed are looked up again), counting a
+        # miss for the first use of each title
+
+        needed = {}
+        hits = 0
+
+        with self.lock:
+            for title in titles:
+                key = normalizeTitle(title)
+                if key not in self.pages:
+                    needed.setdefault(key, title)
+                if key in self.seen:
+                    hits += 1
+                else:
+                    self.seen.add(key)
+            self.hits += hits
+            self.misses += len(titles) - hits
+
+        METRICS.count('memo_hits', hits)
+        METRICS.count('memo_misses', len(titles) - hits)
+
+        return list(needed.values())
+
+    def store(self, pages):
+
+        # Remember the pages looked up
+
+        with self.lock:
+            for title, page in pages.items():
+                self.pages[normalizeTitle(title)] = page
+
+
+class TitlePrefetcher:
+
+    # Looks up Wikipedia titles in a background thread as the Crossref phase
+    # finds them so the two phases overlap, keeping the pages in the memo for
+    # the blocks. Titles arrive through a bounded queue (Crossref waits if the
+    # lookups fall behind). The prefix harvest & dump title database are also
+    # set up in the thread. Titles that fail are left to the blocks while a
+    # failure setting up is raised by finish (as it would have ended the run).
+
+    def __init__(self, site, size, prior, memo, titles, harvest, depth):
+        self.site = site
+        self.size = size
+        self.prior = prior
+        self.memo = memo
+        self.titles = titles
+        self.harvest = harvest
+        self.dump = None
+        self.harvested = None
+        self.error = None
+        self.queue = queue.Queue(maxsize=depth)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def add(self, titles):
+
+        # Queue titles to be looked up (dropped once the thread has failed)
+
+        if self.error is None:
+            self.queue.put(list(titles))
+
+    def finish(self):
+
+        # Wait for the queued titles to be looked up, raising whatever stopped
+        # the thread
+
+        self.queue.put(None)
+        self.thread.join()
+
+        if self.error is not None:
+            raise self.error
+
+    def prefetch(self, titles):
+
+        # Look up the titles not already in the memo
+
+        titles = sorted(title for title in titles if isValidTitle(title) and title not in self.memo)
+
+        for i in range(0, len(titles), self.size):
+            batch = titles[i:i + self.size]
+            with METRICS.phase('prefetch'):
+                try:
+                    self.memo.store(resolveTitles(batch, self.site, self.size, self.prior, self.dump, self.harvested))
+                except (Exception, SystemExit) as e:
+                    # also caught as the blocks will report pages that stop the run
+                    METRICS.count('prefetch_failures')
+                    sys.stderr.write('WARNING: prefetch failed (' + describeError(e) + '), leaving ' + str(len(batch)) + ' titles to the blocks\n')
+            METRICS.items('prefetch', len(batch))
+
+    def run(self):
+
+        # Set up the harvest & dump title database then look up the titles as
+        # they arrive (combining what is waiting into full queries). Anything
+        # that stops the thread is kept for finish to raise.
+
+        finished = False
+
+        try:
+
+            if self.titles:
+                self.dump = openTitleDatabase(TITLESDB, self.site)
+
+            # prefixes are queried with the other titles if harvesting fails
+
+            if self.harvest:
+                with METRICS.phase('harvest'):
+                    try:
+                        self.harvested = harvestPrefixes(self.site)
+                    except Exception as e:
+                        sys.stderr.write('WARNING: harvesting DOI prefix pages failed (' + describeError(e) + '), querying each block\n')
+                if self.harvested is not None:
+                    METRICS.items('harvest', len(self.harvested))
+
+            while not finished:
+
+                item = self.queue.get()
+                if item is None:
+                    finished = True
+                    break
+
+                titles = set(item)
+                while len(titles) < self.size:
+                    try:
+                        item = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        finished = True
+                        break
+                    titles.update(item)
+
+                self.prefetch(titles)
+
+        except BaseException as e:
+            self.error = e
+
+            # keep taking titles so Crossref is not left waiting on a full queue
+
+            while not finished:
+                finished = self.queue.get() is None
+
 #
 # Functions
 #
 
-def checkRateLimitInterval(headers, priorInterval, warning):
+def checkRateLimit(headers, priorLimit, priorInterval, priorConcurrency, warning):
+
+    # Check the rate limit, interval & concurrency limit from the headers
+
+    limit = checkRateLimitValue(headers, 'limit', priorLimit, warning)
+    interval = checkRateLimitValue(headers, 'interval', priorInterval, warning)
+    concurrency = checkRateLimitValue(headers, 'concurrency', priorConcurrency, warning)
 
-    # Check the rate limit interval from the headers
+    if None in (limit, interval, concurrency):
+        warning += 1
 
-    intervalString = headers.get('x-ratelimit-interval') or headers.get('x-rate-limit-interval')
-    if intervalString is None:
-        interval = 1
+    limit = limit or 1
+    interval = interval or 1
+    concurrency = concurrency or WORKERS
+
+    return limit, interval, concurrency, warning
+
+
+def checkRateLimitValue(headers, name, prior, warning):
+
+    # Check a single rate limit header (x-rate-limit-limit, x-rate-limit-interval
+    # or x-concurrency-limit), returns None if missing or invalid
+
+    if name == 'concurrency':
+        label = 'Concurrency limit'
+        string = headers.get('x-concurrency-limit')
+    elif name == 'limit':
+        label = 'Rate limit'
+        string = headers.get('x-ratelimit-limit') or headers.get('x-rate-limit-limit')
+    else:
+        label = 'Rate limit ' + name
+        string = headers.get('x-ratelimit-' + name) or headers.get('x-rate-limit-' + name)
+
+    if string is None:
         if warning == 0:
-            print('WARNING: Rate limit interval not found in headers.')
-            warning += 1
+            print(f'WARNING: {label} not found in headers.')
+        return None
+
+    try:
+        value = int(string.rstrip('s'))
+    except (ValueError, AttributeError):
+        if warning == 0:
+            print(f'WARNING: Unexpected {label.lower()} format {string}.')
+        return None
+
+    if value < 1:
+        return None
+
+    if value != prior:
+        print(f'WARNING: {label} has changed. It is now {string}.')
+
+    return value
+
+
+def deleteCheckpoint(filename):
+
+    # Remove the checkpoint files once the run is complete
+
+    for name in (filename, filename + '.cursor'):
+        if os.path.exists(name):
+            os.remove(name)
+
+    return
+
+
+def getCrossref(url, session, limiter, headers=None):
+
+    # Retrieve a Crossref URL with the session once the rate limiter allows it
+
+    if url.startswith(APIMEMBERS):
+        endpoint = 'crossref-members'
     else:
-        try:
-            interval = int(intervalString.rstrip('s'))
-            if interval != priorInterval:
-                print(f'WARNING: Rate limit interval has changed. It is now {intervalString}.')
-        except (ValueError, AttributeError):
-            interval = 1
-            if warning == 0:
-                print(f'WARNING: Unexpected rate limit interval format {intervalString}.')
-                warning += 1
-    return interval, warning
+        endpoint = 'crossref-prefixes'
 
+    limiter.acquire()
 
-def findTarget(text):
+    try:
+        r = session.get(url, headers=headers, timeout=TIMEOUT)
+    except requests.exceptions.RequestException:
+        limiter.release()
+        METRICS.count('request_errors', endpoint=endpoint)
+        raise
 
-    # Find the target of a redirect
+    # server errors may not carry the rate limit headers
 
-    match = re.search(r'^\s*#redirect\s*:?\s*\[\[\s*:?\s*(.+?)\s*(?:\]|(?<!&)#|\n|\|)', text, re.IGNORECASE)
-    if match:
-        target = match.group(1)
+    if r.status_code >= 500:
+        limiter.release()
     else:
-        target = 'NONE'
+        limiter.release(r.headers)
+
+    METRICS.request(endpoint, r.elapsed.total_seconds(), len(r.content))
 
-    return target
+    if r.status_code == 429 or r.status_code >= 500:
+        raise TransientError('Crossref returned ' + str(r.status_code) + ' for ' + url, r.headers.get('retry-after'))
+
+    return r
 
 
 def getEmail(filename):
@@ -97,8 +606,58 @@ def getEmail(filename):
     return email
 
 
+def getOptions(arguments):
+
+    # Parse the command line options returning resume, refresh, ttl, profile,
+    # whether to use the dump title database & whether to harvest the prefixes
+
+    resume = None
+    refresh = False
+    ttl = CACHETTL
+    profile = False
+    titles = False
+    harvest = False
+
+    try:
+        arguments, values = getopt.getopt(arguments, 'hr:', ['refresh', 'ttl=', 'profile', 'titles-db', 'harvest'])
+    except getopt.error as err:
+        print(str(err))
+        sys.exit(2)
+
+    for argument, value in arguments:
+        if argument == '-h':
+            print('dois-retrieve.py [-h] [-r YYYYMMDD] [--refresh] [--ttl DAYS] [--profile] [--titles-db] [--harvest]')
+            print('  where -r        = resume the run that is writing doi-registrants-YYYYMMDD')
+            print('        --refresh = ignore cached Crossref responses')
+            print('        --ttl     = days cached Crossref responses are used without revalidating (default ' + str(CACHETTL) + ')')
+            print('        --profile = write CPU & memory profiles of each phase to Dois/profiles')
+            print('        --titles-db = answer registrant titles from Citations/db-titles.sqlite3 (live queries only for titles changed since the dump)')
+            print('        --harvest = list every DOI prefix page up front rather than querying each prefix')
+            sys.exit(0)
+        elif argument == '-r':
+            resume = value
+        elif argument == '--refresh':
+            refresh = True
+        elif argument == '--ttl':
+            try:
+                ttl = float(value)
+            except ValueError:
+                print('invalid ttl: ' + value)
+                sys.exit(2)
+        elif argument == '--profile':
+            profile = True
+        elif argument == '--titles-db':
+            titles = True
+        elif argument == '--harvest':
+            harvest = True
+
+    return resume, refresh, ttl, profile, titles, harvest
+
+
 def getStart(filename):
 
+    # Find the prefix following the last one written to the output file
+
     try:
         with open(filename) as file:
             lastLine = list(file)[-1]
@@ -116,35 +675,60 @@ def getStart(filename):
     return prefix
 
 
-def getUserInfo(filename):
+def harvestPrefixes(site):
 
-    # Read in bot userinfo
+    # List every DOI prefix page returning the page (revision id, registrant &
+    # target) of those transcluding the registrant template keyed by title,
+    # with None for the other prefix pages that exist
 
-    userinfo = {}
+    harvested = {}
 
-    try:
-        with open(filename, 'r') as file:
-            for line in file:
-                match = re.search(r'^USERNAME = (.+?)\s*$', line)
-                if match:
-                    userinfo['username'] = match.group(1)
-                match = re.search(r'^PASSWORD = (.+?)\s*$', line)
-                if match:
-                    userinfo['password'] = match.group(1)
+    print('Harvesting DOI prefix pages ...')
 
-        if 'username' not in userinfo:
-            sys.stderr.write('ERROR: username not found\n')
-            sys.exit(1)
+    request = {'list': 'allpages', 'apprefix': '10.', 'apnamespace': 0, 'aplimit': 'max'}
+    parameters = request
 
-        if 'password' not in userinfo:
-            sys.stderr.write('ERROR: password not found\n')
-            sys.exit(1)
+    while True:
 
-    except Exception:
-        traceback.print_exc()
-        sys.exit(1)
+        response = retry(site.api, 'query', **parameters)
+
+        for item in response.get('query', {}).get('allpages', []):
+            if re.search(r'^10\.\d+$', item['title']):
+                harvested[item['title']] = None
 
-    return userinfo
+        if 'continue' not in response:
+            break
+        parameters = dict(request, **response['continue'])
+
+    # revisions are only returned for part of each generator batch at a time
+    # so pages are completed across the continuations (each continuation
+    # replaces the last as a stale rvcontinue would skip the next batch)
+
+    request = {
+        'generator': 'embeddedin', 'geititle': HARVESTTEMPLATE, 'geinamespace': 0, 'geilimit': 'max',
+        'prop': 'revisions', 'rvprop': 'ids|content', 'rvslots': 'main',
+    }
+    parameters = request
+
+    while True:
+
+        response = retry(site.api, 'query', **parameters)
+
+        for item in response.get('query', {}).get('pages', {}).values():
+            title = item['title']
+            if 'revisions' not in item or not re.search(r'^10\.\d+$', title):
+                continue
+            revision = item['revisions'][0]
+            registrant, target = parsePage(title, revisionText(revision))
+            harvested[title] = {'exists': True, 'revid': revision['revid'], 'registrant': registrant, 'target': target}
+
+        if 'continue' not in response:
+            break
+        parameters = dict(request, **response['continue'])
+
+    print('  ' + str(len(harvested)) + ' prefix pages, ' + str(sum(1 for page in harvested.values() if page)) + ' with a registrant')
+
+    return harvested
 
 
 def isValidPrefix(prefix, registrant):
@@ -182,32 +766,188 @@ def isValidTitle(title):
     return True
 
 
-def queryCrossref(email, apiMembers, apiPrefixes, blocksize):
+def loadCheckpoint(filename):
+
+    # Load the Crossref results & the cursor (last order written along with the
+    # output file size at that point) from the checkpoint
+
+    try:
+        with open(filename, 'r') as file:
+            crossref = {order: tuple(value) for order, value in json.load(file).items()}
+
+        cursor = None
+        if os.path.exists(filename + '.cursor'):
+            with open(filename + '.cursor', 'r') as file:
+                order, offset = file.read().split('\t')
+                cursor = (order, int(offset))
+
+    except Exception:
+        traceback.print_exc()
+        sys.exit(1)
+
+    return crossref, cursor
+
+
+def loadPrefixes(filename):
+
+    # Load the revision id, registrant & target of each DOI prefix page
+    # extracted from the dump by dois-dump.py (empty if it has not been run
+    # for the dump or was run before revision ids were kept)
+
+    prefixes = {}
+
+    if os.path.exists(filename):
+        with open(filename) as file:
+            for line in file:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) != 4:
+                    sys.stderr.write('WARNING: ' + filename + ' has no revision ids, run dois-dump.py --refresh\n')
+                    return {}
+                prefixes[fields[0]] = (int(fields[1]), fields[2], fields[3])
+
+    return prefixes
+
+
+def loadRevisions(filename):
+
+    # Load the revision id, registrant & target of every title seen by the
+    # prior run (targets are normalized as earlier runs kept them raw)
+
+    revisions = {}
+
+    if not os.path.exists(filename):
+        return revisions
+
+    try:
+        with open(filename, 'r') as file:
+            for line in file:
+                title, revid, registrant, target = line.rstrip('\n').split('\t')
+                revisions[title] = (int(revid), registrant, normalizeTarget(target))
+
+    except Exception:
+        traceback.print_exc()
+        sys.exit(1)
+
+    return revisions
+
+
+def normalizeTitle(title):
+
+    # Normalize a title as the dump title database stores it
+
+    title = re.sub(r'[\s_]+', ' ', title).strip()
+
+    return title[:1].upper() + title[1:]
+
+
+def openTitleDatabase(filename, site):
+
+    # Open the dump title database & find the titles changed since its dump
+    # (None if it is missing or older than the recent changes kept)
+
+    if not os.path.exists(filename):
+        sys.stderr.write('WARNING: ' + filename + ' not found, using live queries\n')
+        return None
+
+    connection = sqlite3.connect(filename)
+    row = connection.execute("SELECT revision FROM revisions WHERE type = 'date'").fetchone()
+    connection.close()
+
+    if not row:
+        sys.stderr.write('WARNING: no dump date in ' + filename + ', using live queries\n')
+        return None
+
+    dump = datetime.strptime(row[0], '%Y-%m-%d').replace(tzinfo=timezone.utc)
+    if datetime.now(timezone.utc) - dump > timedelta(days=RCMAXAGE):
+        sys.stderr.write('WARNING: dump of ' + row[0] + ' is older than the recent changes kept, using live queries\n')
+        return None
+
+    changed = queryChanges(site, dump)
+    namespaces = {name.lower() for number, name in site.namespaces.items() if number != 0}
+    prefixes = loadPrefixes(DUMPPREFIXES + dump.strftime('%Y%m%d'))
+
+    print('Using titles from the ' + row[0] + ' dump (' + str(len(changed)) + ' changed since, ' + str(len(prefixes)) + ' DOI prefixes) ...')
+
+    return TitleDatabase(filename, changed, namespaces, prefixes)
+
+
+def queryChanges(site, since):
+
+    # Retrieve the titles whose existence or redirect target may have changed
+    # since the time (created, moved, deleted or redirects edited)
+
+    changed = set()
+
+    for change in CHANGES:
+
+        parameters = dict(change, list='recentchanges', rcprop='title|loginfo', rclimit='max',
+                          rcend=since.strftime('%Y-%m-%dT%H:%M:%SZ'))
+
+        while True:
+
+            response = retry(site.api, 'query', **parameters)
+
+            for item in response.get('query', {}).get('recentchanges', []):
+                changed.add(item['title'])
+                if 'target_title' in item.get('logparams', {}):
+                    changed.add(item['logparams']['target_title'])
+
+            if 'continue' not in response:
+                break
+            parameters.update(response['continue'])
+
+    return changed
+
+
+def queryCrossref(email, apiMembers, apiPrefixes, blocksize, cache, feed=None):
 
     # Retrieve registrant names from Crossref by first calling the members API
-    # and then using the prefixes API to resolve any ambiguities
+    # and then using the prefixes API to resolve any ambiguities. Prefixes &
+    # names are passed to feed (if given) as they are found. All requests
+    # share one session so connections are reused across the workers.
+
+    limiter = RateLimiter()
+    session = openSession(email, WORKERS)
 
     print('Retrieving Crossref members ...')
 
-    members = queryCrossrefMembers(email, apiMembers, blocksize)
+    members = defaultdict(list)
+    titles = []
+
+    for item in queryCrossrefMembers(session, apiMembers, blocksize, limiter, cache):
+        name = item['primary-name']
+        for prefix in item['prefixes']:
+            members[prefix].append(name)
+        if feed:
+            titles += item['prefixes'] + [name]
+            if len(titles) >= blocksize:
+                feed(titles)
+                titles = []
+
+    deferred = DeferredQueue('Crossref prefix')
+
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+
+        print('Resolving Crossref ambiguities ...')
 
-    print('Resolving Crossref ambiguities ...')
+        ambiguous = [prefix for prefix in members if len(set(members[prefix])) > 1]
+        names = executor.map(lambda prefix: resolvePrefix(prefix, session, apiPrefixes, limiter, cache, deferred), ambiguous)
+        resolved = dict(zip(ambiguous, tqdm(names, total=len(ambiguous), leave=None)))
+
+    # prefixes that still cannot be resolved keep the first member's name
+
+    retried, failed = deferred.run()
+    resolved.update(retried)
+    session.close()
+
+    if feed:
+        feed(titles + [name for name in resolved.values() if name])
 
     results = {}
 
-    start = 0
-    interval = 1
-    intervalWarning = 0
-
-    for prefix in tqdm(members, leave=None):
-        unique = set(members[prefix])
-        if len(unique) > 1:
-            end = time.time()
-            delta = end - start
-            if delta < interval:
-                time.sleep(interval - delta)
-            registrant, interval, intervalWarning = queryCrossrefPrefixes(prefix, email, apiPrefixes, interval, intervalWarning)
-            start = time.time()
+    for prefix in members:
+        if resolved.get(prefix) is not None:
+            registrant = resolved[prefix]
         else:
             registrant = members[prefix][0]
 
@@ -218,176 +958,552 @@ def queryCrossref(email, apiMembers, apiPrefixes, blocksize):
     return results
 
 
-def queryCrossrefMembers(email, api, blocksize):
+def queryCrossrefMembers(session, api, blocksize, limiter, cache):
 
-    # Retrieve registrant names from Crossref via the members API
+    # Retrieve members from Crossref via the members API yielding each member
+    # record. Pages are retrieved with a deep paging cursor & decoded once.
+    # Cursors expire, so cached pages are only used if the whole listing is.
 
-    results = defaultdict(list)
+    base = api + '?rows=' + str(blocksize)
 
-    offset = 0
-    total = 1
+    count, fresh = cache.get(base + '&pages')
+    if fresh:
+        pages = []
+        for index in range(int(count['text'])):
+            cached, fresh = cache.get(base + '&page=' + str(index))
+            if not fresh:
+                break
+            pages.append(cached['text'])
+        if fresh:
+            for text in pages:
+                yield from json.loads(text)['message']['items']
+            return
 
-    interval = 1
-    intervalWarning = 0
+    cursor = '*'
+    index = 0
 
-    while offset < total:
+    while True:
 
-        start = time.time()
+        url = base + '&cursor=' + quote(cursor, safe='')
+        text = queryCrossrefMembersPage(url, session, limiter)
+        message = json.loads(text)['message']
 
-        url = api + '?rows=1000&offset=' + str(offset) + '&mailto=' + email
+        if not message['items']:
+            break
 
-        try:
-            r = requests.get(url)
-        except requests.exceptions.RequestException as e:
-            sys.stderr.write('ERROR: Unable to retrieve URL.\n')
+        cache.put(base + '&page=' + str(index), 200, text, None, None)
+        yield from message['items']
+
+        cursor = message['next-cursor']
+        index += 1
+
+    cache.put(base + '&pages', 200, str(index), None, None)
+
+
+def queryCrossrefMembersPage(url, session, limiter):
+
+    # Retrieve a single page of the members API. Later pages need this page's
+    # cursor so it cannot be deferred if it keeps failing.
+
+    try:
+        r = retry(getCrossref, url, session, limiter)
+    except (requests.exceptions.RequestException, TransientError) as e:
+        sys.stderr.write('ERROR: Unable to retrieve URL.\n')
+        sys.stderr.write('URL = ' + url + '\n')
+        sys.stderr.write('Exception = ' + str(e) + '\n')
+        sys.exit(1)
+    else:
+
+        if r.status_code == 404:
+            sys.stderr.write('ERROR: 404 status code')
             sys.stderr.write('URL = ' + url + '\n')
-            sys.stderr.write('Exception = ' + str(e) + '\n')
             sys.exit(1)
-        else:
-
-            interval, intervalWarning = checkRateLimitInterval(r.headers, interval, intervalWarning)
 
-            if r.status_code == 404:
-                sys.stderr.write('ERROR: 404 status code')
-                sys.stderr.write('URL = ' + url + '\n')
-                sys.exit(1)
+        if r.status_code != 200:
+            sys.stderr.write('ERROR: Unexpected status code.\n')
+            sys.stderr.write('URL  = ' + url + '\n')
+            sys.stderr.write('Code = ' + str(r.status_code) + '\n')
+            sys.exit(1)
 
-            if r.status_code != 200:
-                sys.stderr.write('ERROR: Unexpected status code.\n')
-                sys.stderr.write('URL  = ' + url + '\n')
-                sys.stderr.write('Code = ' + str(r.status_code) + '\n')
-                sys.exit(1)
+        return r.text
 
-            total = r.json()['message']['total-results']
 
-            for item in r.json()['message']['items']:
-                name = item['primary-name']
-                prefixes = item['prefixes']
-                for prefix in prefixes:
-                    results[prefix].append(name)
+def queryCrossrefPrefixes(doi, session, api, limiter, cache):
 
-            end = time.time()
-            delta = end - start
-            if delta < interval:
-                time.sleep(interval - delta)
+    # Retrieve registrant name from Crossref (request failures are raised)
 
-            offset += blocksize
+    status, text = requestCrossref(api + doi, session, limiter, cache)
 
-    return results
+    if status == 404:
+        return 'NONE'
 
+    if status != 200:
+        raise requests.exceptions.HTTPError('Unexpected status code ' + str(status) + ' for ' + doi)
 
-def queryCrossrefPrefixes(doi, email, api, priorInterval, intervalWarning):
+    message = json.loads(text)['message']
+    name = message['name']
+    prefix = message['prefix']
 
-    # Retrieve registrant name from Crossref
+    if prefix != 'https://id.crossref.org/prefix/' + doi:
+        sys.stderr.write('ERROR: requested ' + doi + '\nreceived ' + prefix + '\n')
+        sys.exit(1)
 
-    try:
-        r = requests.get(api + doi + '?mailto=' + email)
-    except requests.exceptions.RequestException as e:
-        sys.stderr.write('\nERROR: unable to retrieve ' + doi + '\n' + str(e) + '\n')
+    if not name:
+        sys.stderr.write('ERROR: name not found for ' + doi + '\n' + text + '\n')
         sys.exit(1)
-    else:
 
-        interval, intervalWarning = checkRateLimitInterval(r.headers, priorInterval, intervalWarning)
+    return name
 
-        if r.status_code == 404:
-            return 'NONE'
 
-        if r.status_code != 200:
-            sys.stderr.write('ERROR: Unexpected status code.\n')
-            sys.stderr.write('DOI  = ' + str(doi) + '\n')
-            sys.stderr.write('Code = ' + str(r.status_code) + '\n')
-            sys.exit(1)
+def queryWikipedia(titles, site, size, prior):
 
-        name = r.json()['message']['name']
-        prefix = r.json()['message']['prefix']
+    # Retrieve existence, registrant & target for a set of titles using
+    # multi-title queries (size titles per query). Revision ids are checked
+    # first and titles unchanged since the prior run are not re-read.
 
-        if prefix != 'https://id.crossref.org/prefix/' + doi:
-            sys.stderr.write('ERROR: requested ' + doi + '\nreceived ' + prefix + '\n')
-            sys.exit(1)
+    results = {}
+    titles = list(titles)
+
+    for i in range(0, len(titles), size):
+
+        batch = titles[i:i + size]
+
+        # only check revisions if part of the batch was seen before
+
+        if any(title in prior for title in batch):
+            pages = queryWikipediaBatch(batch, site, {'prop': 'info'})
+            fetch = []
+            for title in batch:
+                page = pages[title]
+                if not page['exists']:
+                    results[title] = page
+                elif title in prior and prior[title][0] == page['revid']:
+                    page['registrant'] = prior[title][1]
+                    page['target'] = prior[title][2]
+                    results[title] = page
+                else:
+                    fetch.append(title)
+        else:
+            fetch = batch
 
-        if not name:
-            sys.stderr.write('ERROR: name not found for ' + doi + '\n' + r.text + '\n')
-            sys.exit(1)
+        if not fetch:
+            continue
+
+        pages = queryWikipediaBatch(fetch, site, {'prop': 'revisions', 'rvprop': 'ids|content', 'rvslots': 'main'})
+
+        # titles normalized to the same page share its revision so it is
+        # only parsed once
+
+        parsed = {}
+
+        for title in fetch:
+            page = pages[title]
+            text = page.pop('text')
+            if page['exists']:
+                if page['revid'] not in parsed:
+                    parsed[page['revid']] = parsePage(title, text)
+                page['registrant'], page['target'] = parsed[page['revid']]
+            results[title] = page
+
+    return results
+
+
+def queryWikipediaBatch(titles, site, parameters):
+
+    # Run a single multi-title query returning existence, revision id & text
+    # (if requested) keyed by the requested titles, each with its own copy
+    # as several may be normalized to the same page (failures are raised)
+
+    items = queryPages(site, titles, parameters)
+    results = {}
 
-        return name, interval, intervalWarning
+    for title in titles:
+        page = {'exists': False, 'revid': 0, 'text': ''}
+        item = items.get(title)
+        if item and 'missing' not in item and 'invalid' not in item:
+            page['exists'] = True
+            if 'lastrevid' in item:
+                page['revid'] = item['lastrevid']
+            if 'revisions' in item:
+                page['revid'] = item['revisions'][0]['revid']
+                page['text'] = revisionText(item['revisions'][0])
+        results[title] = page
+
+    return results
 
 
-def queryWikipediaCrossref(title, site):
+def queryWikipediaCrossref(title, pages):
 
     # Retrieve target of Crossref name (if redirect)
 
-    page = site.pages[title]
+    page = pages[title]
 
-    if not page.exists:
+    if not page['exists']:
         return 'NONE'
 
-    target = findTarget(page.text())
-
-    return target
+    return page['target']
 
 
-def queryWikipediaDOI(prefix, site):
+def queryWikipediaDOI(prefix, pages):
 
     # Retrieve registrant & target from Wikipedia
 
-    page = site.pages[prefix]
+    page = pages[prefix]
 
-    if not page.exists:
+    if not page['exists']:
         return ('NONE', 'NONE')
 
-    # extract redirect
+    return (page['registrant'], page['target'])
+
+
+def requestCrossref(url, session, limiter, cache):
+
+    # Retrieve a Crossref URL returning the status code & body. Fresh cached
+    # responses are used as is while stale ones are revalidated.
+
+    cached, fresh = cache.get(url)
+    if fresh:
+        return cached['status'], cached['text']
+
+    headers = {}
+    if cached:
+        if cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        if cached['modified']:
+            headers['If-Modified-Since'] = cached['modified']
+
+    r = retry(getCrossref, url, session, limiter, headers)
+
+    if r.status_code == 304 and cached:
+        cache.touch(url)
+        return cached['status'], cached['text']
+
+    if r.status_code == 200 or r.status_code == 404:
+        cache.put(url, r.status_code, r.text, r.headers.get('etag'), r.headers.get('last-modified'))
+
+    return r.status_code, r.text
+
+
+def resolvePrefix(prefix, session, api, limiter, cache, deferred):
+
+    # Resolve an ambiguous prefix, deferring it if Crossref keeps failing
+
+    try:
+        return queryCrossrefPrefixes(prefix, session, api, limiter, cache)
+    except (requests.exceptions.RequestException, TransientError) as e:
+        deferred.add(prefix, e, queryCrossrefPrefixes, prefix, session, api, limiter, cache)
+        return None
+
+
+def resolveTitles(titles, site, size, prior, dump, harvested):
+
+    # Look up existence, registrant & target of the titles taking DOI prefix
+    # pages from those harvested (those not listed do not exist), then what
+    # the dump title database can answer & querying the rest. Prefix pages
+    # in the dump are only read if edited since (or since the prior run).
+
+    pages = {}
+
+    if harvested is not None:
+        for title in titles:
+            if not re.search(r'^10\.\d+$', title):
+                continue
+            if title not in harvested:
+                pages[title] = {'exists': False, 'revid': 0, 'text': ''}
+            elif harvested[title]:
+                pages[title] = harvested[title]
+        METRICS.count('prefixes_harvested', len(pages))
 
-    target = findTarget(page.text())
+    remaining = set(titles) - set(pages)
 
-    # extract registrant
+    if dump:
+        answered = dump.lookup(remaining)
+        dump.answered += len(answered)
+        dump.live += len(remaining) - len(answered)
+        METRICS.count('titles_dump', len(answered))
+        METRICS.count('titles_live', len(remaining) - len(answered))
+        pages.update(answered)
+        remaining -= set(answered)
 
-    match = re.search(r'{{\s*(?:Template\s*:\s*)?(?:R[ _]+from[ _]+DOI[ _]+prefix|R[ _]+from[ _]+DOI)\s*\|\s*registrant\s*=\s*(.+?)\s*[\|\}]', page.text(), re.IGNORECASE)
-    if match:
-        registrant = match.group(1)
+        known = {}
+        for title in remaining:
+            if title in dump.prefixes:
+                known[title] = max(prior.get(title, (0,)), dump.prefixes[title])
+        pages.update(queryWikipedia(sorted(known), site, size, known))
+        remaining -= set(known)
+
+    pages.update(queryWikipedia(sorted(remaining), site, size, prior))
+
+    return pages
+
+
+def retrieve(site, email, resume=None, refresh=False, ttl=CACHETTL, titles=False, harvest=False, feed=None):
+
+    # Build the registrant snapshot from Crossref & Wikipedia returning the
+    # file name & rows (also saved to the snapshot store). Titles uses the dump
+    # title database for what has not changed since the dump & harvest lists
+    # the DOI prefix pages in bulk. Wikipedia titles are prefetched while
+    # Crossref is queried & the blocks are then written in order (& passed to
+    # feed if given as they are written). Output is:
+    # prefix, crossref registrant, wikipedia registrant, crossref target, wikipedia target
+
+    # determine output & checkpoint files (resume continues an existing run)
+
+    if resume:
+        stamp = resume
     else:
-        match = re.search('registrant', page.text(), re.IGNORECASE)
-        if match:
-            sys.stderr.write('ERROR: registrant not detected for ' + prefix + '\n')
-            sys.exit(1)
-        registrant = 'NONE'
+        stamp = date.today().strftime('%Y%m%d')
+
+    filename = STORAGE + stamp
+    checkpoint = CHECKPOINT + stamp
+
+    start = 0
+    cursor = None
+
+    # revisions from the prior run (kept for the part already done if resuming)
+
+    prior = loadRevisions(REVISIONS)
+    if resume:
+        revisions = dict(prior)
+    else:
+        revisions = {}
+
+    # Wikipedia titles are looked up while Crossref is queried
+
+    size = querySize(site)
+    memo = TitleMemo()
+    prefetcher = TitlePrefetcher(site, size, prior, memo, titles, harvest, PIPELINEDEPTH)
+
+    if resume and os.path.exists(checkpoint):
+        print('Resuming from checkpoint ...')
+        crossref, cursor = loadCheckpoint(checkpoint)
+    else:
+        with METRICS.phase('crossref'):
+            cache = ResponseCache(CACHE, ttl, CACHESIZE, refresh)
+            crossref = queryCrossref(email, APIMEMBERS, APIPREFIXES, BLOCKSIZE, cache, prefetcher.add)
+            cache.close()
+            saveCheckpoint(checkpoint, crossref)
+        METRICS.items('crossref', len(crossref))
+
+    print('Retrieving Wikipedia data ...')
+
+    with METRICS.phase('overlap'):
+        prefetcher.finish()
+
+    dump = prefetcher.dump
+    harvested = prefetcher.harvested
+
+    rows = []
+
+    if cursor:
+        # drop anything written after the last checkpointed block
+        with open(filename, 'r+') as file:
+            file.truncate(cursor[1])
+        rows = readSnapshot(filename)
+        file = open(filename, 'a', 1)
+        start = int(cursor[0]) + 1
+    elif resume and os.path.exists(filename) and os.path.getsize(filename):
+        # no cursor so fall back to the last prefix in the output
+        rows = readSnapshot(filename)
+        file = open(filename, 'a', 1)
+        start = getStart(filename)
+    else:
+        file = open(filename, 'w', 1)
+
+    if feed and rows:
+        feed(rows)
+
+    orders = [order for order in sorted(crossref, key=int) if int(order) >= start]
+
+    progress = tqdm(total=len(orders), leave=None)
+
+    # blocks whose Wikipedia queries keep failing are deferred to the end,
+    # later blocks are held until they can be written in order
+
+    blocks = [orders[i:i + size] for i in range(0, len(orders), size)]
+    deferred = DeferredQueue('Wikipedia block')
+    done = {}
+    position = 0
+
+    for index, block in enumerate(blocks):
+
+        with METRICS.phase('wikipedia'):
+            try:
+                done[index] = retrieveBlock(block, crossref, site, size, prior, revisions, dump, memo, harvested)
+            except Exception as e:
+                deferred.add(index, e, retrieveBlock, block, crossref, site, size, prior, revisions, dump, memo, harvested)
+        METRICS.items('wikipedia', len(block))
+
+        position = writeBlocks(file, blocks, done, position, rows, checkpoint, feed)
+
+        progress.update(len(block))
+
+    progress.close()
+
+    with METRICS.phase('wikipedia'):
+        retried, failed = deferred.run()
+    done.update(retried)
+
+    position = writeBlocks(file, blocks, done, position, rows, checkpoint, feed)
+
+    file.close()
+
+    if memo.hits + memo.misses:
+        print('Registrant titles: ' + str(memo.misses) + ' looked up for ' + str(memo.hits + memo.misses) + ' prefixes (' +
+              str(round(100 * memo.hits / (memo.hits + memo.misses), 1)) + '% memo hits)')
+
+    if dump:
+        print('Answered', dump.answered, 'titles from the dump,', dump.live, 'live')
+        dump.close()
+
+    if failed:
+        # keep what was written & the checkpoint so the run can be resumed
+        saveRevisions(REVISIONS, revisions)
+        sys.stderr.write('ERROR: ' + str(len(failed)) + ' Wikipedia blocks failed, resume with -r ' + stamp + '\n')
+        sys.exit(1)
+
+    with METRICS.phase('store'):
+        saveRevisions(REVISIONS, revisions)
+        store = openStore(STORE)
+        saveSnapshot(store, stamp, rows)
+        store.close()
+    METRICS.items('store', len(rows))
+
+    deleteCheckpoint(checkpoint)
+
+    return filename, rows
+
+
+def retrieveBlock(block, crossref, site, size, prior, revisions, dump, memo, harvested):
+
+    # Query Wikipedia for a block of prefixes returning their rows (& noting
+    # the revision of each title found). Titles already looked up this run
+    # (or prefetched) are taken from the memo.
+
+    prefixes = set()
+    registrants = []
+    for order in block:
+        prefix = crossref[order][0]
+        registrant = crossref[order][1]
+        if isValidTitle(registrant):
+            prefixes.add(prefix)
+            registrants.append(registrant)
+
+    needed = memo.lookup(registrants)
+    titles = set(needed) | {prefix for prefix in prefixes if prefix not in memo}
 
-    return (registrant, target)
+    memo.store(resolveTitles(titles, site, size, prior, dump, harvested))
 
+    for title in prefixes | set(registrants):
+        page = memo[title]
+        if page['exists'] and page['revid']:
+            revisions[title] = (page['revid'], page['registrant'], page['target'])
+
+    rows = []
+
+    for order in block:
+
+        prefix = crossref[order][0]
+        registrant = crossref[order][1]
+
+        if isValidTitle(registrant):
+            target = queryWikipediaCrossref(registrant, memo)
+            wikipedia = queryWikipediaDOI(prefix, memo)
+            rows.append((prefix, registrant, wikipedia[0], target, wikipedia[1]))
+        else:
+            rows.append((prefix, registrant, 'NONE', 'INVALID', 'NONE'))
+
+    return rows
+
+
+def saveCheckpoint(filename, crossref):
+
+    # Save the Crossref results so a resumed run can skip the Crossref phases
+
+    try:
+        with open(filename + '.tmp', 'w') as file:
+            json.dump(crossref, file)
+        os.replace(filename + '.tmp', filename)
+
+    except Exception:
+        traceback.print_exc()
+        sys.exit(1)
+
+    return
+
+
+def saveCursor(filename, order, offset):
+
+    # Save the last order written & the output file size after writing it
+
+    with open(filename + '.cursor.tmp', 'w') as file:
+        file.write(order + '\t' + str(offset))
+    os.replace(filename + '.cursor.tmp', filename + '.cursor')
+
+    return
+
+
+def saveRevisions(filename, revisions):
+
+    # Save the revision id, registrant & target of every title seen
+
+    try:
+        with open(filename + '.tmp', 'w') as file:
+            for title in sorted(revisions):
+                revid, registrant, target = revisions[title]
+                file.write('\t'.join((title, str(revid), registrant, target)) + '\n')
+        os.replace(filename + '.tmp', filename)
+
+    except Exception:
+        traceback.print_exc()
+        sys.exit(1)
+
+    return
+
+
+def writeBlocks(file, blocks, done, position, rows, checkpoint, feed=None):
+
+    # Write the completed blocks from position onwards (stopping at the first
+    # one not done) checkpointing after each (& passing each to feed if given),
+    # returning the new position
+
+    while position in done:
+
+        block = done.pop(position)
+        for row in block:
+            file.write('\t'.join(row) + '\n')
+            rows.append(row)
+
+        file.flush()
+        saveCursor(checkpoint, blocks[position][-1], file.tell())
+
+        if feed:
+            feed(block)
+
+        position += 1
+
+    return position
 
 #
 # Main
 #
 
-userinfo = getUserInfo(BOTINFO)
-email = getEmail(EMAILINFO)
-
-try:
-    site = Site('en.wikipedia.org', clients_useragent='JL-Bot/0.0 (https://en.wikipedia.org/wiki/User_talk:JL-Bot)')
-    site.login(userinfo['username'], userinfo['password'])
-except Exception:
-    traceback.print_exc()
-    sys.exit(1)
+def main(arguments):
 
-crossref = queryCrossref(email, APIMEMBERS, APIPREFIXES, BLOCKSIZE)
+    resume, refresh, ttl, profile, titles, harvest = getOptions(arguments)
 
-filename = os.environ['WIKI_WORKING_DIR'] + '/Dois/doi-registrants-' + date.today().strftime('%Y%m%d')
-file = open(filename, 'w', 1)
+    METRICS.start(METRICSDIR, 'retrieve')
+    if profile:
+        METRICS.profile(PROFILEDIR)
 
-print('Retrieving Wikipedia data ...')
+    site = getSite(BOTINFO)
+    email = getEmail(EMAILINFO)
 
-for order in tqdm(sorted(crossref, key=int), leave=None):
+    retrieve(site, email, resume, refresh, ttl, titles, harvest)
 
-    prefix = crossref[order][0]
-    registrant = crossref[order][1]
-
-    if isValidTitle(registrant):
-        target = queryWikipediaCrossref(registrant, site)
-        wikipedia = queryWikipediaDOI(prefix, site)
-        file.write('\t'.join((prefix, registrant, wikipedia[0], target, wikipedia[1])) + '\n')
-    else:
-        file.write('\t'.join((prefix, registrant, 'NONE', 'INVALID', 'NONE')) + '\n')
+    METRICS.write(METRICSDIR, 'retrieve')
+    METRICS.dump('retrieve')
 
-file.close()
 
-# output is:
-# prefix, crossref registrant, wikipedia registrant, crossref target, wikipedia target
\ No newline at end of file
+if __name__ == '__main__':
+    main(sys.argv[1:])
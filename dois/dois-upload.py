@@ -1,14 +1,23 @@
 #!/usr/bin/python3
 
-import csv
-import glob
+import bisect
+import getopt
+import hashlib
 import inspect
+import itertools
+import math
 import os
-import re
+import queue
 import sys
+import threading
+import time
 import traceback
 
-from mwclient import Site
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from common import METRICS, checkTransient, describeError, getSite, importSnapshots, latestSnapshots, loadSnapshot, openStore, queryPages, querySize, readSnapshot
 
 #
 # Configuration
@@ -22,69 +31,380 @@ if 'WIKI_CONFIG_DIR' not in os.environ:
     sys.stderr.write('ERROR: WIKI_CONFIG_DIR environment variable not set\n')
     sys.exit(1)
 
+DIRECTORY = os.environ['WIKI_WORKING_DIR'] + '/Dois'
+STORAGE = DIRECTORY + '/doi-registrants-'
+STORE = DIRECTORY + '/db-registrants.sqlite3'
+SHARDS = DIRECTORY + '/doi-shards'
+METRICSDIR = DIRECTORY + '/metrics'
+PROFILEDIR = DIRECTORY + '/profiles'
 BOTINFO = os.environ['WIKI_CONFIG_DIR'] + '/bot-info.txt'
+UPLOADWORKERS = 4           # maximum parallel edits (also limited by lag & the edit rate limit)
+WRITEWORKERS = 8            # parallel file writes with --output-dir
+MAXLAG = 5                  # seconds of replication lag before the servers refuse edits
+MAXATTEMPTS = 5             # attempts to save a page before giving up on it
+RETRYDELAY = 5              # seconds before retrying a page (doubled on each attempt)
+SHARDBYTES = 25000          # rendered size of a subpage when one is split
+SHARDROWS = 250             # rows of a subpage when one is split
+MAXBYTES = 2 * SHARDBYTES   # subpages over either maximum are split
+MAXROWS = 2 * SHARDROWS
+MINBYTES = SHARDBYTES // 10 # subpages under this are merged into the one before
+
+#
+# Classes
+#
+
+class UploadScheduler:
+
+    # Saves pages through a bounded pool of workers. Concurrency starts at one
+    # and grows by one after each run of successful saves up to the number of
+    # workers. Whenever the servers report lag (or rate limit the bot) it is
+    # halved & new edits pause for the Retry-After time. Edit starts are also
+    # spaced to the account's edit rate limit. Pages that fail are queued
+    # again (after a delay) up to MAXATTEMPTS times. Pages can be added while
+    # saving until the scheduler is closed.
+
+    def __init__(self, site, pages, workers, rate=None):
+        self.condition = threading.Condition()
+        self.site = site
+        self.pages = pages
+        self.workers = workers
+        self.interval = 1 / rate if rate else 0
+        self.concurrency = 1
+        self.active = 0
+        self.successes = 0
+        self.paused = 0
+        self.next = 0
+        self.queue = deque()
+        self.saved = []
+        self.failed = []
+        self.closed = False
+        self.threads = []
+
+    def add(self, titles):
+
+        # Queue titles to be saved
+
+        with self.condition:
+            self.queue.extend((title, 1, 0) for title in titles)
+            self.condition.notify_all()
+
+    def close(self):
+
+        # Wait for the queued titles to be saved returning those saved & those
+        # that failed
+
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+        for thread in self.threads:
+            thread.join()
+        self.site.connection.hooks['response'].remove(self.observe)
+
+        return self.saved, self.failed
+
+    def finish(self, title, attempt, error=None):
+
+        # Record the result of a save (requeueing the page if it failed)
+
+        with self.condition:
+            self.active -= 1
+            if error is None:
+                self.saved.append(title)
+                self.successes += 1
+                if self.successes >= self.concurrency and self.concurrency < self.workers:
+                    self.concurrency += 1
+                    self.successes = 0
+            elif attempt >= MAXATTEMPTS:
+                self.failed.append(title)
+            else:
+                METRICS.count('save_retries')
+                self.queue.append((title, attempt + 1, time.monotonic() + RETRYDELAY * 2 ** (attempt - 1)))
+            self.condition.notify_all()
+
+    def observe(self, response, *args, **kwargs):
+
+        # Response hook backing off whenever the servers report lag
+
+        if response.headers.get('x-database-lag'):
+            self.throttle(response.headers.get('retry-after'))
+
+    def run(self, titles):
+
+        # Save the titles returning those saved & those that failed
+
+        self.start()
+        self.add(titles)
+
+        return self.close()
+
+    def start(self):
+
+        # Start the workers (which wait for titles until closed, as daemons so
+        # a run that stops early is not held open by them)
+
+        self.site.connection.hooks['response'].append(self.observe)
+        self.threads = [threading.Thread(target=self.work, daemon=True) for i in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def take(self):
+
+        # Wait for a page that is ready & a free slot returning the page
+        # (None once closed with the queue empty & no saves in progress)
+
+        with self.condition:
+            while True:
+
+                if not self.queue and not self.active and self.closed:
+                    self.condition.notify_all()
+                    return None
+
+                now = time.monotonic()
+                start = max(self.paused, self.next)
+                ready = [item for item in self.queue if item[2] <= now]
+
+                if ready and self.active < self.concurrency and start <= now:
+                    self.queue.remove(ready[0])
+                    self.active += 1
+                    self.next = max(now, self.next) + self.interval
+                    return ready[0]
+
+                if self.active >= self.concurrency or not self.queue:
+                    self.condition.wait()
+                else:
+                    self.condition.wait(max(start, min(item[2] for item in self.queue)) - now)
+
+    def throttle(self, delay=None):
+
+        # Halve the concurrency & pause new edits for delay seconds
+
+        try:
+            delay = float(delay)
+        except (TypeError, ValueError):
+            delay = RETRYDELAY
+
+        METRICS.count('save_throttles')
+
+        with self.condition:
+            self.concurrency = max(1, self.concurrency // 2)
+            self.successes = 0
+            self.paused = max(self.paused, time.monotonic() + delay)
+            self.condition.notify_all()
+
+    def work(self):
+
+        # Save pages until there are none left
+
+        while True:
+
+            item = self.take()
+            if item is None:
+                return
+
+            title, attempt, ready = item
+
+            try:
+                savePage(self.site, title, self.pages[title])
+            except Exception as e:
+                transient, delay = checkTransient(e)
+                if transient:
+                    self.throttle(delay)
+                sys.stderr.write('WARNING: unable to save ' + title + ' (attempt ' + str(attempt) + '): ' + describeError(e) + '\n')
+                self.finish(title, attempt, e)
+            else:
+                self.finish(title, attempt)
+
+
+class UploadStream:
+
+    # Renders & saves the subpages as the rows arrive (in prefix order) so
+    # they can be saved while retrieve is still running. Each subpage is
+    # checked & queued for saving once the rows after it show it can no
+    # longer change (those waiting are checked together whenever no more rows
+    # are waiting). The redirects from subpages no longer used are saved once
+    # all rows have arrived & the summary page after everything else. Unless
+    # threaded the rows are only rendered by finish (on the calling thread so
+    # the phases can be profiled).
+
+    def __init__(self, site, threaded=True):
+        self.site = site
+        self.rows = queue.Queue()
+        self.prior = loadShards(SHARDS)
+        self.buckets = set()
+        self.boundaries = []
+        self.pages = {}
+        self.waiting = {}
+        self.changed = []
+        self.error = None
+        self.rate = queryEditRate(site)
+        self.scheduler = UploadScheduler(site, self.pages, UPLOADWORKERS, self.rate)
+        self.scheduler.start()
+        self.thread = None
+        if threaded:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def add(self, rows):
+
+        # Add rows that follow those already added
+
+        self.rows.put(rows)
+
+    def check(self, pages):
+
+        # Queue the pages whose content changed to be saved
+
+        if not pages:
+            return []
+
+        with METRICS.phase('check'):
+            changed = findChanged(self.site, pages)
+        METRICS.items('check', len(pages))
+
+        self.pages.update(pages)
+        self.changed += changed
+
+        return changed
+
+    def finish(self):
+
+        # Wait for the subpages to be saved then save the redirects & summary
+        # page returning the pages rendered, those changed, those saved & those
+        # that failed
+
+        self.rows.put(None)
+        if self.thread:
+            self.thread.join()
+        else:
+            self.run()
+        if self.error:
+            self.scheduler.close()
+            raise self.error
+
+        index = dict(renderIndex(self.boundaries, self.prior or sorted(self.buckets)))
+        summary = {'User:JL-Bot/DOI': index.pop('User:JL-Bot/DOI')}
+
+        self.scheduler.add(self.check(index))
+
+        with METRICS.phase('save'):
+            saved, failed = self.scheduler.close()
+            scheduler = UploadScheduler(self.site, self.pages, 1, self.rate)
+            last = scheduler.run(self.check(summary))
+        METRICS.items('save', len(saved) + len(last[0]))
+
+        return self.pages, self.changed, saved + last[0], failed + last[1]
+
+    def flush(self):
+
+        # Render, check & queue the subpages waiting
+
+        if not self.waiting:
+            return
+
+        with METRICS.phase('render'):
+            pages = {title: formatPage(content) for title, content in self.waiting.items()}
+        self.waiting = {}
+
+        self.scheduler.add(self.check(pages))
+
+    def lines(self):
+
+        # Yield the rendered line of each valid row as they arrive (checking
+        # the subpages waiting before waiting for more)
+
+        while True:
+
+            if self.rows.empty():
+                self.flush()
+
+            rows = self.rows.get()
+            if rows is None:
+                return
+
+            lines = []
+            with METRICS.phase('render'):
+                for row in rows:
+                    if isValid(row):
+                        number = int(row[0].replace('10.', ''))
+                        self.buckets.add(number - number % 250)
+                        lines.append((number, formatLine(row)))
+            METRICS.items('render', len(rows))
+
+            yield from lines
+
+    def run(self):
+
+        # Render the subpages from the rows as they arrive
+
+        try:
+            for boundary, content in generateShards(self.lines(), self.prior):
+                self.boundaries.append(boundary)
+                self.waiting['User:JL-Bot/DOI/10.' + str(boundary)] = content
+            self.flush()
+        except Exception as e:
+            self.error = e
 
 #
 # Functions
 #
 
-def determinePage(doi):
+def determineShards(lines, boundaries):
 
-    # Find page for a given suffix
+    # Split the rendered lines (prefix number, text) into subpages returning
+    # the first prefix number & lines of each along with the boundaries used
+    # (the quarter-thousand buckets if there were none)
 
-    if len(doi) == 7:
-        start = 4
-        end = 6
-    elif len(doi) == 8:
-        start = 5
-        end = 7
-    else:
-        sys.stderr.write('ERROR: unknown doi length: ' + doi + '\n')
-        sys.exit(1)
+    if not boundaries:
+        boundaries = sorted({number - number % 250 for number, text in lines})
 
-    value = doi[start:end]
+    return list(generateShards(lines, boundaries)), boundaries
 
-    if value < '25':
-        page = doi[:start] + '000'
-    elif value < '50':
-        page = doi[:start] + '250'
-    elif value < '75':
-        page = doi[:start] + '500'
-    else:
-        page = doi[:start] + '750'
 
-    return page
+def findBucket(number, boundaries):
 
+    # Return the boundary of the subpage a prefix number falls in (its
+    # quarter-thousand bucket if there are no boundaries)
 
-def getUserInfo(filename):
+    if not boundaries:
+        return number - number % 250
 
-    # Read in bot userinfo
+    return boundaries[max(0, bisect.bisect_right(boundaries, number) - 1)]
 
-    userinfo = {}
 
-    try:
-        with open(filename, 'r') as file:
-            for line in file:
-                match = re.search(r'^USERNAME = (.+?)\s*$', line)
-                if match:
-                    userinfo['username'] = match.group(1)
-                match = re.search(r'^PASSWORD = (.+?)\s*$', line)
-                if match:
-                    userinfo['password'] = match.group(1)
-
-        if 'username' not in userinfo:
-            sys.stderr.write('ERROR: username not found\n')
-            sys.exit(1)
+def findChanged(site, pages):
 
-        if 'password' not in userinfo:
-            sys.stderr.write('ERROR: password not found\n')
-            sys.exit(1)
+    # Compare the SHA-1 of each rendered page with the current revision
+    # (retrieved in multi-title queries) returning the titles that differ.
+    # Titles that cannot be checked are treated as changed.
 
-    except Exception:
-        traceback.print_exc()
-        sys.exit(1)
+    size = querySize(site)
+    titles = list(pages)
+    current = {}
 
-    return userinfo
+    for i in range(0, len(titles), size):
+
+        batch = titles[i:i + size]
+
+        try:
+            items = queryPages(site, batch, {'prop': 'revisions', 'rvprop': 'sha1'})
+        except Exception as e:
+            sys.stderr.write('WARNING: unable to check ' + batch[0] + ' onwards, saving them: ' + describeError(e) + '\n')
+            continue
+
+        for title, item in items.items():
+            if 'revisions' in item:
+                current[title] = item['revisions'][0].get('sha1')
+
+    changed = []
+
+    for title in titles:
+        # MediaWiki strips trailing whitespace when saving
+        sha1 = hashlib.sha1(pages[title].rstrip().encode('utf-8')).hexdigest()
+        if current.get(title) != sha1:
+            changed.append(title)
+
+    return changed
 
 
 def formatLine(line):
@@ -99,22 +419,21 @@ def formatLine(line):
     crossrefTarget = line[3]
     wikipediaTarget = line[4]
 
-    result = '{{JCW-DOI-prefix'
-    result += '|' + prefix
+    chunks = ['{{JCW-DOI-prefix|', prefix]
 
     # Crossref registrant
 
     if crossrefRegistrant == 'NONE':
-        result += '|-'
+        chunks.append('|-')
     else:
-        result += '|' + crossrefRegistrant
+        chunks += ['|', crossrefRegistrant]
 
     # Wikipedia registrant
 
     if wikipediaRegistrant == 'NONE':
-        result += '|-'
+        chunks.append('|-')
     else:
-        result += '|' + wikipediaRegistrant
+        chunks += ['|', wikipediaRegistrant]
 
     # Target
 
@@ -125,20 +444,107 @@ def formatLine(line):
         crossrefTarget = ':' + crossrefTarget
 
     if crossrefTarget == 'NONE' and wikipediaTarget == 'NONE':
-        result += '|-'
+        chunks.append('|-')
     elif crossrefTarget == 'NONE':
-        result += '|' + wikipediaTarget
+        chunks += ['|', wikipediaTarget]
     elif wikipediaTarget == 'NONE':
-        result += '|' + crossrefTarget
+        chunks += ['|', crossrefTarget]
     elif crossrefTarget != wikipediaTarget:
-        result += '|4=Crossref = [[' + crossrefTarget + ']]<br/>'
-        result += 'Wikipedia = [[' + wikipediaTarget + ']]'
+        chunks += ['|4=Crossref = [[', crossrefTarget, ']]<br/>Wikipedia = [[', wikipediaTarget, ']]']
     else:
-        result += '|' + crossrefTarget
+        chunks += ['|', crossrefTarget]
+
+    chunks.append('}}\n')
+
+    return ''.join(chunks)
+
+
+def formatPage(rows):
+
+    # Create the subpage text from the rendered table rows (joined once)
+
+    return ''.join(itertools.chain(['{{JCW-DOI-prefix-top}}\n'], rows, ['{{JCW-DOI-prefix-bottom}}\n']))
+
+
+def formatRedirect(doi):
+
+    # Create a redirect from a subpage that is no longer used
+
+    return '#REDIRECT [[User:JL-Bot/DOI/' + doi + ']]\n'
+
+
+def formatSummary(listing):
+
+    # Create a summary page listing all subpages
+
+    chunks = [inspect.cleandoc('''<inputbox>
+        bgcolor=
+        type=fulltext
+        prefix=User:JL-Bot/DOI/
+        break=yes
+        width=70
+        searchbuttonlabel=Search DOI registrants
+        </inputbox>
+
+        These pages are listing of Crossref registrants:
+        {{columns-list|
+    '''), '\n']
+    for doi in listing:
+        chunks += ['* [[User:JL-Bot/DOI/', doi, '|', doi, ']]\n']
+
+    chunks.append('* [[User:JL-Bot/DOI/Deltas|Deltas]]\n')
+    chunks.append('}}\n')
+
+    return ''.join(chunks)
+
 
-    result += '}}\n'
+def generateShards(lines, boundaries):
 
-    return result
+    # Split the rendered lines (prefix number, text in prefix order) into
+    # subpages yielding the first prefix number & lines of each once it can
+    # no longer change. Subpages keep the boundaries of the prior run (the
+    # quarter-thousand buckets if there are none) so few pages move. Only
+    # those over MAXBYTES or MAXROWS are split (into pieces of about
+    # SHARDBYTES & SHARDROWS) and those under MINBYTES are merged into the one
+    # before, so the last subpage is held until the next group is complete.
+
+    last = None
+
+    for boundary, group in itertools.groupby(lines, lambda line: findBucket(line[0], boundaries)):
+
+        group = list(group)
+        sizes = [len(text.encode('utf-8')) for number, text in group]
+        size = sum(sizes)
+
+        if size > MAXBYTES or len(group) > MAXROWS:
+            # cut where the running size crosses each multiple of size / pieces
+
+            pieces = max(math.ceil(size / SHARDBYTES), math.ceil(len(group) / SHARDROWS))
+            cuts = []
+            total = 0
+            for index, length in enumerate(sizes[:-1]):
+                total += length
+                if total >= size * (len(cuts) + 1) / pieces:
+                    cuts.append(index + 1)
+            for start, end in zip([0] + cuts, cuts + [len(group)]):
+                piece = group[start:end]
+                if last:
+                    yield last[0], [text for number, text in last[1]]
+                last = [boundary if start == 0 else piece[0][0], piece, sum(sizes[start:end])]
+
+        elif last and size < MINBYTES and last[2] + size <= SHARDBYTES and len(last[1]) + len(group) <= SHARDROWS:
+            last[1].extend(group)
+            last[2] += size
+
+        else:
+            if last:
+                yield last[0], [text for number, text in last[1]]
+            last = [boundary, group, size]
+
+    if last:
+        yield last[0], [text for number, text in last[1]]
+
+    return
 
 
 def isValid(line):
@@ -155,99 +561,226 @@ def isValid(line):
     return True
 
 
-def savePage(site, doi, content):
+def loadShards(filename):
+
+    # Load the first prefix number of each subpage from the prior run
+
+    if not os.path.exists(filename):
+        return []
+
+    try:
+        with open(filename, 'r') as file:
+            boundaries = [int(line) for line in file if line.strip()]
+
+    except Exception:
+        traceback.print_exc()
+        sys.exit(1)
+
+    return boundaries
 
-    # save content to wikipedia page
 
-    page = 'User:JL-Bot/DOI/' + doi
+def queryEditRate(site):
+
+    # Determine the edits per second allowed for the account (None if it is
+    # not rate limited). Every limit applying to the account is enforced so
+    # the strictest is used.
+
+    if 'noratelimit' in site.rights:
+        return None
+
+    try:
+        response = site.api('query', meta='userinfo', uiprop='ratelimits')
+        limits = response['query']['userinfo'].get('ratelimits', {}).get('edit', {})
+    except Exception:
+        traceback.print_exc()
+        return None
+
+    rates = [limit['hits'] / limit['seconds'] for limit in limits.values() if limit.get('seconds')]
+    if not rates:
+        return None
 
-    print('Saving', page, '...')
+    return min(rates)
 
-    text = '{{JCW-DOI-prefix-top}}\n'
-    text += content
-    text += '{{JCW-DOI-prefix-bottom}}\n'
 
-    page = site.pages[page]
-    page.save(text, 'DOI prefix registrant listing')
+def renderIndex(boundaries, prior):
+
+    # Generate (title, text) for the redirects from subpages no longer used
+    # (to the one now holding their prefixes) & the summary page
+
+    listing = ['10.' + str(boundary) for boundary in boundaries]
+
+    for boundary in sorted(set(prior) - set(boundaries)):
+        index = max(0, bisect.bisect_right(boundaries, boundary) - 1)
+        yield 'User:JL-Bot/DOI/10.' + str(boundary), formatRedirect(listing[index])
+
+    yield 'User:JL-Bot/DOI', formatSummary(listing)
 
     return
 
 
-def saveSummary(site, listing):
+def renderLines(rows):
 
-    # save a summary page listing all subpages
+    # Render the table row of each valid line keyed by its prefix number
 
-    page = 'User:JL-Bot/DOI'
+    return [(int(line[0].replace('10.', '')), formatLine(line)) for line in rows if isValid(line)]
 
-    print('Saving', page, '...')
 
-    text = inspect.cleandoc('''<inputbox>
-        bgcolor=
-        type=fulltext
-        prefix=User:JL-Bot/DOI/
-        break=yes
-        width=70
-        searchbuttonlabel=Search DOI registrants
-        </inputbox>
+def renderPages(shards, prior):
 
-        These pages are listing of Crossref registrants:
-        {{columns-list|
-    ''')
-    text += '\n'
-    for doi in listing:
-        text += '* [[User:JL-Bot/DOI/' + doi + '|' + doi + ']]\n'
+    # Generate (title, text) for the subpages, the redirects from subpages no
+    # longer used & the summary page (needs no site so can render offline)
 
-    text += '* [[User:JL-Bot/DOI/Deltas|Deltas]]\n'
-    text += '}}\n'
+    for boundary, content in shards:
+        yield 'User:JL-Bot/DOI/10.' + str(boundary), formatPage(content)
 
-    page = site.pages[page]
-    page.save(text, 'DOI prefix registrant listing')
+    yield from renderIndex([boundary for boundary, content in shards], prior)
 
     return
 
-#
-# Main
-#
 
-# initiate bot
+def savePage(site, title, text):
 
-userinfo = getUserInfo(BOTINFO)
+    # save content to wikipedia page (refused while replication lag exceeds
+    # MAXLAG seconds)
 
-try:
-    site = Site('en.wikipedia.org', clients_useragent='JL-Bot/0.0 (https://en.wikipedia.org/wiki/User_talk:JL-Bot)')
-    site.login(userinfo['username'], userinfo['password'])
-except Exception:
-    traceback.print_exc()
-    sys.exit(1)
+    sys.stdout.write('Saving ' + title + ' ...\n')
+
+    page = site.pages[title]
+    page.save(text, 'DOI prefix registrant listing', maxlag=MAXLAG)
+
+    return
 
-# iterate through input file
 
-files = glob.glob(os.environ['WIKI_WORKING_DIR'] + '/Dois/doi-registrants-*')
-filename = sorted(files)[-1]
+def saveShards(filename, boundaries):
 
-print('FILE =', filename)
+    # Save the first prefix number of each subpage for the next run
 
-current = '10.1000'
-output = ''
-pages = []
+    try:
+        with open(filename + '.tmp', 'w') as file:
+            for boundary in boundaries:
+                file.write(str(boundary) + '\n')
+        os.replace(filename + '.tmp', filename)
 
-try:
-    with open(filename, 'r') as file:
-        lines = csv.reader(file, delimiter='\t')
-        for line in lines:
-            if isValid(line):
-                page = determinePage(line[0])
-                if page != current:
-                    savePage(site, current, output)
-                    pages.append(current)
-                    current = page
-                    output = ''
-                output += formatLine(line)
+    except Exception:
+        traceback.print_exc()
+        sys.exit(1)
 
-    pages.append(current)
-    savePage(site, current, output)
-    saveSummary(site, pages)
+    return
 
-except Exception:
-    traceback.print_exc()
-    sys.exit(1)
+
+def upload(site, filename, rows=None, stream=None):
+
+    # Render the subpages & summary page for a snapshot (read from the file
+    # unless the rows are given) and save those that changed. With a stream
+    # the rows were added to it as they were retrieved.
+
+    print('FILE =', filename)
+
+    try:
+        if stream is None:
+            if rows is None:
+                rows = readSnapshot(filename)
+            stream = UploadStream(site, False)
+            stream.add(rows)
+
+        pages, changed, saved, failed = stream.finish()
+
+        METRICS.count('pages_saved', len(saved))
+        METRICS.count('pages_skipped', len(pages) - len(changed))
+        METRICS.count('pages_failed', len(failed))
+
+        print('Saved', len(saved), 'pages, skipped', len(pages) - len(changed), 'unchanged pages')
+
+        if failed:
+            sys.stderr.write('ERROR: unable to save ' + ', '.join(failed) + '\n')
+        else:
+            saveShards(SHARDS, stream.boundaries)
+
+    except Exception:
+        traceback.print_exc()
+        sys.exit(1)
+
+    return
+
+
+def writePage(directory, title, text):
+
+    # Write a rendered page to a file in the directory named from its title
+
+    filename = os.path.join(directory, quote(title, safe=':') + '.wiki')
+    with open(filename + '.tmp', 'w') as file:
+        file.write(text)
+    os.replace(filename + '.tmp', filename)
+
+    return
+
+
+def writePages(directory, pages):
+
+    # Write each rendered (title, text) page to the directory in parallel,
+    # returning the number written
+
+    os.makedirs(directory, exist_ok=True)
+
+    with ThreadPoolExecutor(max_workers=WRITEWORKERS) as executor:
+        futures = [executor.submit(writePage, directory, title, text) for title, text in pages]
+        for future in futures:
+            future.result()
+
+    return len(futures)
+
+#
+# Main
+#
+
+def main(arguments):
+
+    output = None
+
+    try:
+        arguments, values = getopt.getopt(arguments, 'h', ['output-dir=', 'profile'])
+    except getopt.error as err:
+        print(str(err))
+        sys.exit(2)
+
+    for argument, value in arguments:
+        if argument == '-h':
+            print('dois-upload.py [-h] [--output-dir DIR] [--profile]')
+            print('  uploads the latest doi-registrants file to Wikipedia')
+            print('  where --output-dir = write the rendered pages to files in DIR instead (no login)')
+            print('        --profile = write CPU & memory profiles of each phase to Dois/profiles')
+            sys.exit(0)
+        elif argument == '--output-dir':
+            output = value
+        elif argument == '--profile':
+            METRICS.profile(PROFILEDIR)
+
+    METRICS.start(METRICSDIR, 'upload')
+
+    # latest snapshot from the store
+
+    store = openStore(STORE)
+    importSnapshots(store, DIRECTORY)
+    snapshot = latestSnapshots(store, 1)[0]
+    rows = loadSnapshot(store, snapshot)
+    store.close()
+
+    if output:
+        try:
+            with METRICS.phase('render'):
+                shards, prior = determineShards(renderLines(rows), loadShards(SHARDS))
+                written = writePages(output, renderPages(shards, prior))
+            METRICS.items('render', len(rows))
+        except Exception:
+            traceback.print_exc()
+            sys.exit(1)
+        print('Wrote', written, 'pages to', output)
+    else:
+        upload(getSite(BOTINFO), STORAGE + snapshot, rows)
+
+    METRICS.write(METRICSDIR, 'upload')
+    METRICS.dump('upload')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])